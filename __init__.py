@@ -1,6 +1,7 @@
 from .variable import *
 from .function import *
 from .evaluation import *
+from .executors import *
 from .documentation import *
 from .tools import LabelReplacer
 from .tools import ArrayLabelReplacer
@@ -8,13 +9,29 @@ from .tools import PreStringHandler
 from .tools import TableReader
 from .tools import LabeledTableReader
 from .tools import TableWriter
+from .tools import NpyReader
+from .tools import NpyWriter
+from .tools import RawReader
+from .tools import RawWriter
 from .tools import BoundConstraints
 from .tools import GradientScale
+from .tools import SharedArray
+from .tools import SharedArrayReader
+from .tools import SharedArrayWriter
 from .drivers import ExteriorPenaltyDriver
 from .drivers import ScipyDriver
+from .drivers import DOEDriver
+from .drivers import SurrogateTrustRegionDriver
+from .drivers import EvaluationScheduler
+from .drivers import getScheduler
 # Import IpOpt driver if possible.
 try: from .drivers import IpoptDriver
 except: pass
 from .optimizers import goldenSection
 from .optimizers import quadraticInterp
+from .optimizers import parallelGoldenSection
+from .optimizers import parallelQuadraticInterp
+from .optimizers import strongWolfe
 from .optimizers import fletcherReeves
+from .optimizers import lbfgs
+from .optimizers import LBFGSMemory
@@ -1,5 +1,8 @@
+from .scheduler import *
 from .exterior_penalty import *
 from .scipy_driver import *
+from .doe_driver import *
+from .surrogate_driver import *
 # Import IpOpt driver if possible.
 try: from .ipopt_driver import *
 except: pass
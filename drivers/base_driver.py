@@ -16,8 +16,8 @@
 #  along with FADO.  If not, see <https://www.gnu.org/licenses/>.
 
 import os
-import shutil
 import numpy as np
+from .design_storage import DesignStorage
 
 
 class DriverBase:
@@ -81,6 +81,11 @@ class DriverBase:
         self._workDir = "__WORKDIR__"
         self._dirPrefix = "DSN_"
         self._keepDesigns = True
+        self._recycle = False
+        self._stagedBytes = []
+        self._outputBytes = []
+        self._footprintRecorded = False
+        self._storage = DesignStorage()
         self._failureMode = "HARD"
         self._logObj = None
         self._logColWidth = 13
@@ -103,9 +108,15 @@ class DriverBase:
         function  : A function object.
         scale     : Scale applied to the function, optimizer will see function*scale.
         weight    : Weight given to the objective, only relevant for multiple objectives.
+
+        The components of composite functions (e.g. WeightedSum) are added as monitors.
         """
         self._objectives.append(self._Objective(type,function,scale,weight))
 
+        monitored = [obj.function for obj in self._monitors]
+        for component in function.getComponents():
+            if component not in monitored: self.addMonitor(component)
+
     def addEquality(self,function,target=0.0,scale=1.0):
         """
         Add an equality constraint, function = target, the optimizer will see (function-target)*scale.
@@ -138,6 +149,10 @@ class DriverBase:
         """Set the name of the working directory where each iteration runs, it should not exist."""
         self._workDir = dir
 
+    # the working directory is relative to the user directory (unless absolute)
+    def _getWorkDir(self):
+        return os.path.join(self._userDir,self._workDir)
+
     def getNumVariables(self):
         """Returns the size of the design vector."""
         N=0
@@ -230,17 +245,118 @@ class DriverBase:
         self._userDir = os.path.abspath(os.curdir)
     #end
 
-    def setStorageMode(self,keepDesigns=False,dirPrefix="DSN_"):
+    def setStorageMode(self,keepDesigns=False,dirPrefix="DSN_",archive=None,background=True):
         """
         Set whether to keep or discard (default) old optimization iterations.
+        Old working directories are renamed immediately, deleting or compressing
+        them is done by a background worker (unless background=False).
 
         Parameters
         ----------
-        keepDesigns : True to keep all designs.
+        keepDesigns : True to keep all designs (see also setRetentionPolicy).
         dirPrefix   : Prefix used to name folders with old designs.
+        archive     : None, "gztar", or "xztar", to compress the folders of old designs.
+        background  : True to delete or compress old designs in the background.
         """
         self._keepDesigns = keepDesigns
         self._dirPrefix = dirPrefix
+        self._storage.setArchiveMode(archive)
+        self._storage.setBackground(background)
+
+    def setRetentionPolicy(self,keepBest=0,keepEvery=0,keepLast=0):
+        """
+        Set which old designs are kept when keepDesigns=True, a design is kept if it meets
+        any of the criteria. If all criteria are 0 (default) all designs are kept.
+
+        Parameters
+        ----------
+        keepBest  : Keep the N designs with lowest (scaled) objective value plus constraint
+                    violation, or lowest penalized function for ExteriorPenaltyDriver.
+        keepEvery : Keep every k-th design.
+        keepLast  : Keep the M most recent designs.
+        """
+        self._storage.setRetentionPolicy(keepBest,keepEvery,keepLast)
+
+    def setRecycleMode(self,recycle=True):
+        """
+        Set whether the working directory, and the subdirectories of the evaluations, are
+        recycled between designs instead of being deleted and created anew.
+        Old designs are not stored in this mode. Must be called after adding all functions.
+
+        See also
+        --------
+        ExternalRun.setRecycle and ExternalRun.addKeptOutput.
+        """
+        self._recycle = recycle
+        for evl in self._getAllEvaluations():
+            evl.setRecycle(recycle)
+    #end
+
+    def setScratchDirectory(self,path):
+        """
+        Run all evaluations in node-local scratch directories created in "path" (e.g. /dev/shm),
+        use None to disable. The files read by the functions, and the relative data files of
+        the evaluations, are copied back to the working directory. Must be called after adding
+        all functions.
+
+        See also
+        --------
+        ExternalRun.setScratchDirectory and ExternalRun.addSyncBack.
+        """
+        evals = self._getAllEvaluations()
+
+        # the files read by the functions and by other runs are copied back
+        files = []
+        for function in self._getAllFunctions():
+            files += function.getFiles()
+        for evl in evals:
+            files += evl.getRelativeData()
+
+        for evl in evals:
+            evl.setScratchDirectory(path)
+            evl.setDownstreamFiles(files)
+        #end
+    #end
+
+    def setOutputCapture(self,mode="file",maxBytes=1048576,compress=False):
+        """
+        Set how the output of all evaluations is captured, see ExternalRun.setOutputCapture.
+        Must be called after adding all functions.
+        """
+        for evl in self._getAllEvaluations():
+            evl.setOutputCapture(mode,maxBytes,compress)
+    #end
+
+    def getStagedBytes(self):
+        """Return a list with the number of bytes copied to stage the files of each design."""
+        self._recordFootprint()
+        return self._stagedBytes
+
+    def getOutputBytes(self):
+        """Return a list with the number of bytes of captured output (stdout/stderr) of each design."""
+        self._recordFootprint()
+        return self._outputBytes
+
+    # record the staging and output footprint of the current design, the entry is
+    # updated until the design changes as more evaluations take place
+    def _recordFootprint(self):
+        evals = [evl for evl in self._getAllEvaluations() if evl.isIni() or evl.isError()]
+        if not evals: return
+        staged = sum(evl.getStagedBytes() for evl in evals)
+        output = sum(evl.getOutputBytes() for evl in evals if evl.isRun())
+        if self._footprintRecorded:
+            self._stagedBytes[-1] = staged
+            self._outputBytes[-1] = output
+        else:
+            self._stagedBytes.append(staged)
+            self._outputBytes.append(output)
+            self._footprintRecorded = True
+        #end
+    #end
+
+    def waitForStorage(self):
+        """Wait for the background deletion/compression of old designs to finish."""
+        self._storage.wait()
 
     def setFailureMode(self,mode):
         """
@@ -267,6 +383,21 @@ class DriverBase:
         """Set a postprocessing action executed after evaluating function gradients."""
         self._userPostProcessGrad = callableOrString
 
+    # list of all functions, in the order objectives, constraints, monitors
+    def _getAllFunctions(self):
+        return [obj.function for obj in self._objectives+self._constraintsEQ+\
+                self._constraintsGT+self._monitors]
+
+    # list of unique evaluations (value and gradient) of all functions
+    def _getAllEvaluations(self):
+        evals = []
+        for function in self._getAllFunctions():
+            for evl in function.getValueEvalChain()+function.getGradientEvalChain():
+                if evl not in evals: evals.append(evl)
+        #end
+        return evals
+    #end
+
     def _resetAllValueEvaluations(self):
         for obj in self._objectives:
             obj.function.resetValueEvalChain()
@@ -305,6 +436,14 @@ class DriverBase:
         self._hisObj.write(hisLine)
     #end
 
+    # Value used to rank stored designs, the (scaled) objective plus the constraint violation.
+    def _rankingValue(self):
+        value = self._ofval.sum()
+        value += abs(self._eqval).sum()
+        value -= np.minimum(self._gtval,0.0).sum()
+        return value
+    #end
+
     # Detect a change in the design vector, reset directories and evaluation state.
     def _handleVariableChange(self, x):
         assert x.size == self._nVar, "Wrong size of design vector."
@@ -315,6 +454,14 @@ class DriverBase:
 
         # otherwise...
 
+        # value of the design being replaced, used to rank stored designs
+        oldValue = np.inf
+        if self._funReady and self._ofval is not None: oldValue = self._rankingValue()
+
+        # finalize the footprint of the design being replaced
+        self._recordFootprint()
+        self._footprintRecorded = False
+
         # update the values of the variables
         self._setCurrent(x)
         self._x[()] = x
@@ -326,17 +473,20 @@ class DriverBase:
         self._resetAllGradientEvaluations()
 
         # manage working directories
-        os.chdir(self._userDir)
-        if os.path.isdir(self._workDir):
+        workDir = self._getWorkDir()
+        if self._recycle:
+            if not os.path.isdir(workDir): os.mkdir(workDir)
+            return True
+        #end
+        if os.path.isdir(workDir):
             if self._keepDesigns:
-                dirName = self._dirPrefix+str(self._funEval).rjust(3,"0")
-                if os.path.isdir(dirName): shutil.rmtree(dirName)
-                os.rename(self._workDir,dirName)
+                dirName = os.path.join(self._userDir,self._dirPrefix+str(self._funEval).rjust(3,"0"))
+                self._storage.store(workDir,dirName,self._funEval,oldValue)
             else:
-                shutil.rmtree(self._workDir)
+                self._storage.discard(workDir)
             #end
         #end
-        os.mkdir(self._workDir)
+        os.mkdir(workDir)
 
         return True
     #end
@@ -0,0 +1,175 @@
+#  Copyright 2019-2025, FADO Contributors (cf. AUTHORS.md)
+#
+#  This file is part of FADO.
+#
+#  FADO is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Lesser General Public License as published
+#  by the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  FADO is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public License
+#  along with FADO.  If not, see <https://www.gnu.org/licenses/>.
+
+import os
+import shutil
+import tarfile
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+
+class DesignStorage:
+    """
+    Manages the directories of old designs. Directories are renamed immediately
+    (which is cheap) and the expensive operations, deletion or compression, are
+    carried out by a background worker, one at a time and in order of submission.
+
+    Parameters
+    ----------
+    background : If False the operations are carried out immediately.
+    """
+    _ARCHIVE_MODES = {"gztar" : ("w:gz",".tar.gz"), "xztar" : ("w:xz",".tar.xz")}
+
+    def __init__(self,background=True):
+        self._background = background
+        self._worker = None
+        self._pending = []
+        self._archive = None
+        # retention policy
+        self._keepBest = 0
+        self._keepEvery = 0
+        self._keepLast = 0
+        # (index, value, path) of the stored designs
+        self._designs = []
+        # archives that may still be in the process of being created
+        self._archives = set()
+    #end
+
+    def setBackground(self,background):
+        self._background = background
+
+    def setArchiveMode(self,archive):
+        """Set the compression of stored designs, None, "gztar", or "xztar"."""
+        if archive is not None and archive not in self._ARCHIVE_MODES:
+            raise ValueError("Archive mode must be None, \"gztar\", or \"xztar\".")
+        self._archive = archive
+    #end
+
+    def setRetentionPolicy(self,keepBest=0,keepEvery=0,keepLast=0):
+        """
+        Set which stored designs are kept, a design is kept if it meets any of the criteria.
+        If all criteria are 0 (default) all designs are kept.
+
+        Parameters
+        ----------
+        keepBest  : Keep the N designs with lowest value.
+        keepEvery : Keep every k-th design.
+        keepLast  : Keep the M most recent designs.
+        """
+        self._keepBest = keepBest
+        self._keepEvery = keepEvery
+        self._keepLast = keepLast
+    #end
+
+    def store(self,src,dst,index,value):
+        """
+        Rename directory "src" to "dst" (any existing "dst" is discarded), compress
+        it if an archive mode is set, and apply the retention policy.
+        "value" is used to rank designs (lower is better).
+        """
+        # background jobs must not depend on the current directory
+        src = os.path.abspath(src)
+        dst = os.path.abspath(dst)
+        if self._archive is None:
+            self._discardExisting(dst)
+            os.rename(src,dst)
+        else:
+            # the directory is compressed from a unique temporary location
+            mode, ext = self._ARCHIVE_MODES[self._archive]
+            tmp = tempfile.mkdtemp(prefix=".archive_",dir=os.path.dirname(dst))
+            os.rename(src,os.path.join(tmp,os.path.basename(dst)))
+            dst += ext
+            self._discardExisting(dst)
+            self._archives.add(dst)
+            self._submit(self._compress,tmp,dst,mode)
+        #end
+        self._designs.append((index,value,dst))
+        self._applyRetention()
+    #end
+
+    def discard(self,path):
+        """Move "path" (file or directory) out of the way immediately and delete it later."""
+        path = os.path.abspath(path)
+        isArchive = path in self._archives
+        self._archives.discard(path)
+        if not os.path.lexists(path):
+            # it may be an archive that is still being created
+            if isArchive: self._submit(self._remove,path)
+            return
+        #end
+        parent = os.path.dirname(path)
+        trash = tempfile.mkdtemp(prefix=".trash_",dir=parent)
+        os.rename(path,os.path.join(trash,os.path.basename(path)))
+        self._submit(shutil.rmtree,trash,True)
+    #end
+
+    def wait(self):
+        """Wait for all background operations to finish, re-raising any error."""
+        pending = self._pending
+        self._pending = []
+        for job in pending:
+            job.result()
+    #end
+
+    # discard an existing file or directory about to be replaced
+    def _discardExisting(self,path):
+        self._designs = [d for d in self._designs if d[2] != path]
+        self.discard(path)
+    #end
+
+    def _applyRetention(self):
+        if self._keepBest <= 0 and self._keepEvery <= 0 and self._keepLast <= 0: return
+
+        keep = set()
+        if self._keepBest > 0:
+            keep.update(d[2] for d in sorted(self._designs,key=lambda d: d[1])[0:self._keepBest])
+        if self._keepEvery > 0:
+            keep.update(d[2] for d in self._designs if d[0]%self._keepEvery == 0)
+        if self._keepLast > 0:
+            keep.update(d[2] for d in self._designs[-self._keepLast:])
+
+        for design in self._designs:
+            if design[2] not in keep: self.discard(design[2])
+        self._designs = [d for d in self._designs if d[2] in keep]
+    #end
+
+    @staticmethod
+    def _remove(path):
+        if os.path.isdir(path): shutil.rmtree(path)
+        elif os.path.lexists(path): os.remove(path)
+    #end
+
+    @staticmethod
+    def _compress(tmp,dst,mode):
+        with tarfile.open(dst,mode) as tar:
+            for name in os.listdir(tmp):
+                tar.add(os.path.join(tmp,name),arcname=name)
+        shutil.rmtree(tmp)
+    #end
+
+    def _submit(self,fun,*args):
+        if not self._background:
+            fun(*args)
+            return
+        #end
+        if self._worker is None:
+            self._worker = ThreadPoolExecutor(1)
+        # keep only the jobs that have not finished, or that failed
+        self._pending = [j for j in self._pending if not j.done() or j.exception() is not None]
+        self._pending.append(self._worker.submit(fun,*args))
+    #end
+#end
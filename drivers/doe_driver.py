@@ -0,0 +1,165 @@
+#  Copyright 2019-2025, FADO Contributors (cf. AUTHORS.md)
+#
+#  This file is part of FADO.
+#
+#  FADO is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Lesser General Public License as published
+#  by the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  FADO is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public License
+#  along with FADO.  If not, see <https://www.gnu.org/licenses/>.
+
+import os
+import numpy as np
+from .parallel_eval_driver import ParallelEvalDriver
+
+
+class DOEDriver(ParallelEvalDriver):
+    """
+    Design of experiments driver, evaluates the functions (objectives, constraints, and
+    monitors, all are treated the same) at samples of the design space defined by the
+    bounds of the variables. The samples are evaluated concurrently (see evaluateBatch)
+    and the results are appended to a file as each sample completes, which allows
+    interrupted studies to be resumed. The working directory of sample k is DOE_k.
+    """
+    def __init__(self):
+        ParallelEvalDriver.__init__(self)
+        self._samples = None
+    #end
+
+    def preprocessVariables(self):
+        """Setup method that must be called after all functions are added to the driver."""
+        self._preprocessVariables()
+
+    def preprocess(self):
+        """Alias for preprocessVariables."""
+        self._preprocessVariables()
+
+    def setSampling(self,method="lhs",numSamples=0,levels=2,seed=None):
+        """
+        Generate the samples within the bounds of the variables (which must be finite).
+
+        Parameters
+        ----------
+        method     : "lhs" (Latin hypercube), "sobol" (requires SciPy), or "factorial".
+        numSamples : Number of samples for the "lhs" and "sobol" methods (must be positive).
+        levels     : Number of levels per variable for the "factorial" method, an integer
+                     or a list with one value per component of the design vector.
+        seed       : Seed of the random number generator. A study can only be resumed if
+                     the same samples are generated, i.e. the seed needs to be set.
+        """
+        nVar = self.getNumVariables()
+        if method in ("lhs","sobol") and numSamples <= 0:
+            raise ValueError("The number of samples must be positive.")
+        if method == "lhs":
+            rng = np.random.default_rng(seed)
+            U = np.zeros((numSamples,nVar))
+            for j in range(nVar):
+                U[:,j] = (rng.permutation(numSamples)+rng.random(numSamples))/numSamples
+        elif method == "sobol":
+            try:
+                from scipy.stats import qmc
+            except ImportError:
+                raise ImportError("Sobol sampling requires scipy.stats.qmc.")
+            U = qmc.Sobol(nVar,seed=seed).random(numSamples)
+        elif method == "factorial":
+            levels = np.broadcast_to(levels,(nVar,))
+            axes = [np.linspace(0.0,1.0,n) if n > 1 else np.array([0.5]) for n in levels]
+            U = np.array([g.flatten() for g in np.meshgrid(*axes,indexing="ij")]).transpose()
+        else:
+            raise ValueError("Sampling method must be \"lhs\", \"sobol\", or \"factorial\".")
+        #end
+
+        lb = self.getLowerBound()
+        ub = self.getUpperBound()
+        if not (np.isfinite(lb).all() and np.isfinite(ub).all()) or \
+           (abs(lb) >= 1e20).any() or (abs(ub) >= 1e20).any():
+            raise ValueError("The variables must have finite bounds.")
+
+        self.setSamples(lb+U*(ub-lb))
+    #end
+
+    def setSamples(self,X):
+        """Set the samples (one per row) directly, the design vectors are scaled like the bounds."""
+        X = np.atleast_2d(np.array(X,float))
+        assert X.shape[1] == self.getNumVariables(), "Wrong size of design vector."
+        self._samples = X
+    #end
+
+    def getSamples(self):
+        """Returns the samples, one per row."""
+        return self._samples
+
+    def run(self,resultsFile="doe_results.csv",maxParallel=None,delim=",  "):
+        """
+        Evaluate the samples, skipping those that have been successfully evaluated
+        according to the results file. Each line of the file contains the index of
+        the sample, the values of the variables (unscaled), the function values,
+        and whether the evaluation succeeded. Returns the results as a 2D array
+        with one row per sample and NaN for failed evaluations.
+
+        Parameters
+        ----------
+        resultsFile : Path of the results file, created if it does not exist.
+        maxParallel : Maximum number of simultaneous evaluations, see evaluateBatch.
+        delim       : Delimiter of the results file.
+        """
+        if self._samples is None: raise RuntimeError("No samples were set.")
+        if maxParallel is None: maxParallel = self._maxParallel
+        resultsFile = os.path.abspath(resultsFile)
+
+        functions = self._getAllFunctions()
+        X = self._samples
+        F = np.full((X.shape[0],len(functions)),np.nan)
+        todo = self._readResults(resultsFile,F,delim)
+
+        def writeLine(i,design):
+            k = todo[i]
+            F[k,:] = design.values
+            data = [str(k)] + [str(x) for x in X[k,:]/self._varScales]
+            data += [str(y) for y in design.values] + [str(not design.error)]
+            fid.write(delim.join(data)+"\n")
+            fid.flush()
+        #end
+
+        newFile = not os.path.exists(resultsFile)
+        with open(resultsFile,"a") as fid:
+            if newFile:
+                header = ["SAMPLE"] + ["X"+str(j) for j in range(X.shape[1])]
+                header += [fun.getName() for fun in functions] + ["SUCCESS"]
+                fid.write(delim.join(header)+"\n")
+            #end
+            if todo:
+                self._runBatch(X[todo,:],[functions]*len(todo),0,maxParallel,"DOE_",writeLine,
+                               indices=todo)
+        #end
+        return F
+    #end
+
+    # Reads the results of a previous run into F, returns the indices of the samples to run.
+    def _readResults(self,resultsFile,F,delim):
+        done = set()
+        if os.path.exists(resultsFile):
+            nVar = self._samples.shape[1]
+            with open(resultsFile) as fid:
+                lines = fid.readlines()[1:]
+            for line in lines:
+                data = line.strip().split(delim.strip() or None)
+                if len(data) != nVar+F.shape[1]+2 or data[-1].strip() != "True": continue
+                k = int(data[0])
+                x = np.array(data[1:nVar+1],float)*self._varScales
+                if k >= F.shape[0] or not np.allclose(x,self._samples[k,:]):
+                    raise RuntimeError("The results file does not match the samples.")
+                F[k,:] = np.array(data[nVar+1:-1],float)
+                done.add(k)
+            #end
+        #end
+        return [k for k in range(F.shape[0]) if k not in done]
+    #end
+#end
@@ -15,7 +15,6 @@
 #  You should have received a copy of the GNU Lesser General Public License
 #  along with FADO.  If not, see <https://www.gnu.org/licenses/>.
 
-import os
 import time
 import copy
 import numpy as np
@@ -32,6 +31,10 @@ class ExteriorPenaltyDriver(ParallelEvalDriver):
     ----------
     tol         : Constraint violation tolerance.
     freq        : Frequency for auto updating the penalty factors, 0 disables auto update.
+                  It is counted in gradient evaluations, or in iterations if iterationCallback
+                  is used by the optimizer, which lbfgs and fletcherReeves do by default.
+                  Other optimizers that evaluate gradients during line searches (e.g. SciPy's)
+                  must be given the callback to avoid updates in the middle of line searches.
     rini        : Initial penalty factor.
     rmax        : Maximum penalty factor.
     factorUp    : Multiplicative increase rate for penalties of constraints out of tolerance.
@@ -56,7 +59,13 @@ class ExteriorPenaltyDriver(ParallelEvalDriver):
         self._grad = None
         self._old_grad = None
 
+        # quasi-Newton memory invalidated by large updates
+        self._qnMemory = None
+        self._qnThreshold = 0.0
+
         # timers, counters, flags
+        self._numIter = 0
+        self._iterCallback = False
         self._isInit = False
         self._isFeasible = False
         self._logRowFormat = ""
@@ -152,8 +161,18 @@ class ExteriorPenaltyDriver(ParallelEvalDriver):
         """Evaluate the penalized function at "x"."""
         self._initialize()
         self._evaluateFunctions(x)
+        return self._penalizedValue()
+    #end
 
-        # combine results
+    async def afun(self,x):
+        """Coroutine version of fun, the evaluations run as asyncio subprocesses."""
+        self._initialize()
+        await self._aevaluateFunctions(x)
+        return self._penalizedValue()
+    #end
+
+    # combine results
+    def _penalizedValue(self):
         f  = self._ofval.sum()
         f += (self._eqpen*self._eqval**2).sum()
         for (g,r) in zip(self._gtval,self._gtpen): f += r*min(0.0,g)*g
@@ -161,6 +180,45 @@ class ExteriorPenaltyDriver(ParallelEvalDriver):
         return f
     #end
 
+    # stored designs are ranked by the penalized function
+    def _rankingValue(self):
+        return self._penalizedValue()
+
+    def funBatch(self,X):
+        """
+        Evaluate the penalized function at several designs (rows of "X") concurrently,
+        see evaluateBatch. Failed evaluations without a default value give inf.
+        The results of the best design are kept, if it is then evaluated via fun or grad
+        (e.g. the step accepted by a line search) they become those of the current design.
+        """
+        self._initialize()
+        result, designs = self._evaluateBatch(X,False,self._maxParallel,"BATCH_",True)
+        F = result["fun"]
+
+        # shift constraints and scale as required
+        nOF = len(self._objectives)
+        nEQ = len(self._constraintsEQ)
+        f = np.zeros((F.shape[0],))
+        for i, obj in enumerate(self._objectives):
+            f += F[:,i]*obj.scale
+        for i, (obj,r) in enumerate(zip(self._constraintsEQ,self._eqpen)):
+            g = (F[:,nOF+i] - obj.bound) * obj.scale
+            f += r*g**2
+        for i, (obj,r) in enumerate(zip(self._constraintsGT,self._gtpen)):
+            g = (F[:,nOF+nEQ+i] - obj.bound) * obj.scale
+            f += r*np.minimum(0.0,g)*g
+
+        f[np.isnan(f)] = np.inf
+
+        # the best design is kept, its results are reused if it becomes the current one
+        best = int(np.argmin(f))
+        for i, design in enumerate(designs):
+            if i == best: self._retainBatchDesign(design,f[i])
+            elif not self._keepDesigns: self._storage.discard(design.dir)
+        #end
+        return f
+    #end
+
     def grad(self,x):
         """Evaluate the gradient of the penalized function at "x"."""
         try:
@@ -172,6 +230,23 @@ class ExteriorPenaltyDriver(ParallelEvalDriver):
         #end
     #end
 
+    async def agrad(self,x):
+        """Coroutine version of grad, the evaluations run as asyncio subprocesses."""
+        try:
+            self._initialize()
+            if await self._aevaluateGradients(x):
+                self._jacTime -= time.time()
+                self._combineGradients()
+                self._jacTime += time.time()
+                self._concludeIteration()
+            #end
+            return self._grad
+        except:
+            if self._failureMode == "HARD": raise
+            return self._old_grad
+        #end
+    #end
+
     # this method decorates the parent method by combining the gradient
     def _evaluateGradients(self,x):
         self._initialize()
@@ -179,38 +254,95 @@ class ExteriorPenaltyDriver(ParallelEvalDriver):
         # if nothing is evaluated return without doing more work
         if not ParallelEvalDriver._evaluateGradients(self,x): return
 
-        # evaluate all required gradients (skip those where the constraint is not active)
         self._jacTime -= time.time()
-        os.chdir(self._workDir)
 
+        self._combineGradients()
+
+        if not self._parallelEval:
+            self._runAction(self._userPostProcessGrad)
+
+        self._jacTime += time.time()
+
+        self._concludeIteration()
+    #end
+
+    # evaluate all required gradients (skip those where the constraint is not active)
+    def _combineGradients(self):
         self._grad[()] = 0.0
+        workDir = self._getWorkDir()
 
         for obj in self._objectives:
-            self._grad += obj.function.getGradient(self._variableStartMask)*obj.scale
+            self._grad += obj.function.getGradient(self._variableStartMask,workDir)*obj.scale
 
         for (obj,f,r) in zip(self._constraintsEQ,self._eqval,self._eqpen):
-            self._grad += 2.0*r*f*obj.function.getGradient(self._variableStartMask)*obj.scale
+            self._grad += 2.0*r*f*obj.function.getGradient(self._variableStartMask,workDir)*obj.scale
 
         for (obj,f,r) in zip(self._constraintsGT,self._gtval,self._gtpen):
             if f < 0.0:
-                self._grad += 2.0*r*f*obj.function.getGradient(self._variableStartMask)*obj.scale
+                self._grad += 2.0*r*f*obj.function.getGradient(self._variableStartMask,workDir)*obj.scale
 
         self._grad /= self._varScales
+    #end
 
-        if not self._parallelEval:
-            self._runAction(self._userPostProcessGrad)
-
-        self._jacTime += time.time()
-        os.chdir(self._userDir)
-
-        # update penalties and params (evaluating the gradient concludes an outer iteration)
-        if self._freq > 0:
+    # update penalties and params (evaluating the gradient concludes an outer iteration,
+    # unless the iterations are marked by iterationCallback)
+    def _concludeIteration(self):
+        if self._freq > 0 and not self._iterCallback:
             if self._jacEval % self._freq == 0: self.update()
 
         # make copy to use as fallback
         self._old_grad[()] = self._grad
     #end
 
+    def iterationCallback(self,x=None):
+        """
+        Callback that marks the end of an optimizer iteration, used by default by lbfgs and
+        fletcherReeves (and that can be passed as the callback of scipy.optimize.minimize). Once it is
+        used the automatic updates take place every "freq" calls, instead of every "freq" gradient
+        evaluations, so that they never happen in the middle of a line search.
+        Returns True if the penalized function was updated.
+        """
+        self._iterCallback = True
+        self._numIter += 1
+        if self._freq > 0 and self._numIter % self._freq == 0:
+            self.update()
+            return True
+        #end
+        return False
+    #end
+
+    def getIterationCallback(self):
+        """
+        Return iterationCallback, the automatic updates are counted in its calls from now on.
+        Used by lbfgs and fletcherReeves when the "fun" method of the driver is passed to them.
+        """
+        self._iterCallback = True
+        return self.iterationCallback
+    #end
+
+    def setQuasiNewtonMemory(self,memory,threshold=0.0):
+        """
+        Attach a quasi-Newton memory (e.g. LBFGSMemory) that is cleared by update() if the
+        relative change of any penalty factor or (numeric) Parameter value exceeds "threshold".
+        Changes of non-numeric parameters always clear the memory.
+        """
+        self._qnMemory = memory
+        self._qnThreshold = threshold
+    #end
+
+    # largest relative change between two lists of penalties or parameter values
+    @staticmethod
+    def _relativeChange(old,new):
+        change = 0.0
+        for (a,b) in zip(old,new):
+            try:
+                if a != b: change = max(change,abs(b-a)/max(abs(a),abs(b)))
+            except:
+                change = np.inf
+        #end
+        return change
+    #end
+
     def update(self,paramsIfFeasible=False):
         """
         If a constraint is active and above tolerance increase the penalties, otherwise decrease them
@@ -218,6 +350,10 @@ class ExteriorPenaltyDriver(ParallelEvalDriver):
         Increment all Parameters associated with the Functions of the problem (via the evaluation steps).
         If paramsIfFeasible=True the Parameter update only takes place if the current design is feasible.
         """
+        # parameters at the top of their range are not changed by updates
+        movable = [par for par in self._parameters if not par.isAtTop()]
+        oldValues = list(self._eqpen)+list(self._gtpen)+[par.getValue() for par in movable]
+
         self._isFeasible = True
 
         # equality (always active)
@@ -239,6 +375,13 @@ class ExteriorPenaltyDriver(ParallelEvalDriver):
             for par in self._parameters:
                 par.increment()
 
+        # the curvature information is no longer valid if the function changed too much
+        if self._qnMemory is not None:
+            newValues = list(self._eqpen)+list(self._gtpen)+[par.getValue() for par in movable]
+            if self._relativeChange(oldValues,newValues) > self._qnThreshold:
+                self._qnMemory.clear()
+        #end
+
         # trigger new evaluations
         self._x[()] = 1e20
         self._funReady = False
@@ -15,7 +15,6 @@
 #  You should have received a copy of the GNU Lesser General Public License
 #  along with FADO.  If not, see <https://www.gnu.org/licenses/>.
 
-import os
 import time
 import numpy as np
 import ipyopt as opt
@@ -78,11 +77,9 @@ class IpoptDriver(ConstrainedOptimizationDriver):
         try:
             self._evaluateGradients(x)
 
-            os.chdir(self._workDir)
-
             out[()] = 0.0
             for obj in self._objectives:
-                out += obj.function.getGradient(self._variableStartMask) * obj.scale
+                out += obj.function.getGradient(self._variableStartMask,self._getWorkDir()) * obj.scale
             out /= self._varScales
 
             # keep reference to result to use as fallback on next iteration if needed
@@ -97,7 +94,6 @@ class IpoptDriver(ConstrainedOptimizationDriver):
             self._runAction(self._userPostProcessGrad)
 
         self._jacTime += time.time()
-        os.chdir(self._userDir)
 
         return out
     #end
@@ -125,18 +121,16 @@ class IpoptDriver(ConstrainedOptimizationDriver):
         try:
             self._evaluateGradients(x)
 
-            os.chdir(self._workDir)
-
             i = 0
             mask = self._variableStartMask
 
             for con in self._constraintsEQ:
-                out[i:(i+self._nVar)] = con.function.getGradient(mask) * con.scale / self._varScales
+                out[i:(i+self._nVar)] = con.function.getGradient(mask,self._getWorkDir()) * con.scale / self._varScales
                 i += self._nVar
             #end
             for (con,f) in zip(self._constraintsGT, self._gtval):
                 if f < 0.0 or not self._asNeeded:
-                    out[i:(i+self._nVar)] = con.function.getGradient(mask) * con.scale / self._varScales
+                    out[i:(i+self._nVar)] = con.function.getGradient(mask,self._getWorkDir()) * con.scale / self._varScales
                 else:
                     out[i:(i+self._nVar)] = 0.0
                 #end
@@ -155,7 +149,6 @@ class IpoptDriver(ConstrainedOptimizationDriver):
             self._runAction(self._userPostProcessGrad)
 
         self._jacTime += time.time()
-        os.chdir(self._userDir)
 
         return out
     #end
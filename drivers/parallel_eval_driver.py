@@ -16,9 +16,14 @@
 #  along with FADO.  If not, see <https://www.gnu.org/licenses/>.
 
 import os
+import copy
 import time
+import asyncio
+import numpy as np
 import subprocess as sp
 from .base_driver import DriverBase
+from ..executors import ExecutorBase
+from ..function import _initializeStep
 
 
 class ParallelEvalDriver(DriverBase):
@@ -47,100 +52,202 @@ class ParallelEvalDriver(DriverBase):
         self._funEvalGraph = None
         self._jacEvalGraph = None
         self._waitTime = 10.0
+        self._maxParallel = 0
+
+        # slots shared with other drivers, and those held by this one
+        self._scheduler = None
+        self._schedulerSlots = 0
+
+        # batch design (value, design) whose results may become the current design
+        self._retainedDesign = None
     #end
 
-    def setEvaluationMode(self,parallel=True,waitTime=10.0):
+    def setEvaluationMode(self,parallel=True,waitTime=10.0,maxParallel=0):
         """
         Set parallel or sequential (default) evaluation modes. In parallel mode the
-        driver will check if it can start new evaluations every "waitTime" seconds.
+        driver will check if it can start new evaluations every "waitTime" seconds,
+        and at most "maxParallel" evaluations run simultaneously (0 for no limit).
         Builds the evaluation graphs (dependencies) for parallel execution.
         """
         self._parallelEval = parallel
-        if not parallel: return # no need to build graphs
         self._waitTime = waitTime
+        self._maxParallel = maxParallel
+        if not parallel: return # no need to build graphs
+
+        self._funEvalGraph, self._jacEvalGraph = self._buildEvalGraphs()
+    #end
+
+    def setScheduler(self,scheduler,priority=1.0):
+        """
+        Share the evaluation slots with other drivers via an EvaluationScheduler
+        (e.g. the process-wide one from getScheduler), in addition to the "maxParallel"
+        limit. The "priority" sets the share of slots of this driver, None detaches it.
+        """
+        if self._scheduler is not None: self._scheduler.unregister(self)
+        self._scheduler = scheduler
+        self._schedulerSlots = 0
+        if scheduler is not None: scheduler.register(self,priority)
+    #end
+
+    # ask the scheduler for slots to start the "pending" evaluations, at most "slots"
+    # (-1 for no limit), returns the slots that can be used
+    def _requestSlots(self,slots,pending):
+        if self._scheduler is None: return slots
+        if slots >= 0: pending = min(slots,pending)
+        slots = self._scheduler.tryAcquire(self,pending)
+        self._schedulerSlots += slots
+        return slots
+    #end
+
+    # keep one slot per "running" evaluation and give the others back
+    def _settleSlots(self,running):
+        if self._scheduler is None: return
+        self._scheduler.release(self,self._schedulerSlots-running)
+        self._schedulerSlots = min(self._schedulerSlots,running)
+    #end
+
+    # build the dependency graphs of the value and gradient evaluations of
+    # a list of functions (by default all the functions of the driver)
+    def _buildEvalGraphs(self,functions=None):
+        if functions is None: functions = self._getAllFunctions()
 
         # get all unique evaluation steps
         valEvals = set()
         jacEvals = set()
-
-        def _addEvals(flist,vlist,jlist):
-            for obj in flist:
-                vlist.update(obj.function.getValueEvalChain())
-                jlist.update(obj.function.getGradientEvalChain())
-            #end
+        for function in functions:
+            valEvals.update(function.getValueEvalChain())
+            jacEvals.update(function.getGradientEvalChain())
         #end
-        _addEvals(self._objectives   ,valEvals,jacEvals)
-        _addEvals(self._constraintsEQ,valEvals,jacEvals)
-        _addEvals(self._constraintsGT,valEvals,jacEvals)
-        _addEvals(self._monitors     ,valEvals,jacEvals)
 
         # for each unique evaluation list its direct dependencies
-        self._funEvalGraph = dict(zip(valEvals,[set() for i in range(len(valEvals))]))
-        self._jacEvalGraph = dict(zip(jacEvals,[set() for i in range(len(jacEvals))]))
-
-        def _addDependencies(flist,funGraph,jacGraph):
-            for obj in flist:
-                evals = obj.function.getValueEvalChain()
-                for i in range(1,len(evals)):
-                    funGraph[evals[i]].add(evals[i-1])
-
-                evals = obj.function.getGradientEvalChain()
-                for i in range(1,len(evals)):
-                    jacGraph[evals[i]].add(evals[i-1])
-            #end
+        funEvalGraph = dict(zip(valEvals,[set() for i in range(len(valEvals))]))
+        jacEvalGraph = dict(zip(jacEvals,[set() for i in range(len(jacEvals))]))
+
+        for function in functions:
+            for evl, dep in function.getValueEvalDependencies():
+                funEvalGraph[evl].add(dep)
+
+            for evl, dep in function.getGradientEvalDependencies():
+                jacEvalGraph[evl].add(dep)
         #end
-        _addDependencies(self._objectives   ,self._funEvalGraph,self._jacEvalGraph)
-        _addDependencies(self._constraintsEQ,self._funEvalGraph,self._jacEvalGraph)
-        _addDependencies(self._constraintsGT,self._funEvalGraph,self._jacEvalGraph)
-        _addDependencies(self._monitors     ,self._funEvalGraph,self._jacEvalGraph)
+
+        return funEvalGraph, jacEvalGraph
     #end
 
-    # run the active evaluations of a dependency graph
-    def _evalInParallel(self,dependGraph,active):
+    # One pass over the active evaluations of a dependency graph, updates the running
+    # ones and starts at most "slots" (if >= 0) of those whose dependencies are met,
+    # in "baseDir". Returns whether all evaluations completed, if any failed, and the
+    # slots left.
+    @staticmethod
+    def _evalSweep(dependGraph,active,slots,baseDir=None):
         # to avoid exiting with dangling evaluations we need to catch
         # all exceptions and throw when the infinite loop finishes
         error = False
+        allRun = True
         completed = lambda evl: evl.isRun() or evl.isError()
-        while True:
-            allRun = True
-            for evl,depList in dependGraph.items():
-                if not active[evl]: continue
-
-                # ensure all dependencies are active
-                for dep in depList:
-                    active[dep] = True
-
-                # either running or finished, move on
-                if evl.isIni() or completed(evl):
-                    try:
-                        evl.poll() # (starts or updates internal state)
-                        allRun &= completed(evl)
-                    except:
-                        error = True
-                    #end
-                    continue
+        for evl,depList in dependGraph.items():
+            if not active[evl]: continue
+
+            # ensure all dependencies are active
+            for dep in depList:
+                active[dep] = True
+
+            # either running or finished, move on
+            if evl.isIni() or completed(evl):
+                try:
+                    evl.poll() # (starts or updates internal state)
+                    allRun &= completed(evl)
+                except:
+                    error = True
                 #end
-                allRun &= completed(evl)
-
-                # if dependencies are met start evaluation, error is considered
-                # as "met" otherwise the outer loop would never exit
-                for dep in depList:
-                    if not completed(dep): break
-                else:
-                    try:
-                        evl.initialize()
-                        evl.poll()
-                    except:
-                        error = True
-                    #end
+                continue
+            #end
+            allRun = False
+
+            # if dependencies are met start evaluation, error is considered
+            # as "met" otherwise the outer loop would never exit
+            if slots == 0: continue
+            for dep in depList:
+                if not completed(dep): break
+            else:
+                slots -= 1
+                try:
+                    _initializeStep(evl,baseDir)
+                    evl.poll()
+                except:
+                    error = True
                 #end
             #end
+        #end
+        return allRun, error, slots
+    #end
+
+    # number of evaluations of a graph that are running
+    @staticmethod
+    def _numRunning(dependGraph):
+        return sum(evl.isIni() and not (evl.isRun() or evl.isError()) for evl in dependGraph)
+
+    # number of active evaluations of a graph that can be started (as in _evalSweep)
+    @staticmethod
+    def _numReady(dependGraph,active):
+        started = lambda evl: evl.isIni() or evl.isRun() or evl.isError()
+        completed = lambda evl: evl.isRun() or evl.isError()
+        return sum(active[evl] and not started(evl) and all(map(completed,depList))
+                   for evl,depList in dependGraph.items())
+
+    # run the active evaluations of a dependency graph
+    def _evalInParallel(self,dependGraph,active):
+        error = False
+        while True:
+            slots = -1
+            if self._maxParallel > 0: slots = self._maxParallel-self._numRunning(dependGraph)
+            slots = self._requestSlots(slots,self._numReady(dependGraph,active))
+            allRun, err, _ = self._evalSweep(dependGraph,active,slots,self._getWorkDir())
+            ExecutorBase.flushAll()
+            self._settleSlots(self._numRunning(dependGraph))
+            error |= err
             if allRun: break
             time.sleep(self._waitTime)
         #end
         if error: raise RuntimeError("Evaluations failed.")
     #end
 
+    # asyncio version of _evalInParallel, each evaluation is a task that waits for the
+    # tasks of its dependencies (failures are considered "met" as in _evalSweep)
+    async def _aevalGraph(self,dependGraph,active):
+        baseDir = self._getWorkDir()
+        slots = None
+        if self._maxParallel > 0: slots = asyncio.Semaphore(self._maxParallel)
+        tasks = {}
+
+        def schedule(evl):
+            if evl not in tasks: tasks[evl] = asyncio.ensure_future(run(evl))
+            return tasks[evl]
+        #end
+
+        async def run(evl):
+            deps = [schedule(dep) for dep in dependGraph[evl]]
+            if deps: await asyncio.gather(*deps,return_exceptions=True)
+            if slots is None: return await runWithScheduler(evl)
+            async with slots:
+                return await runWithScheduler(evl)
+        #end
+
+        async def runWithScheduler(evl):
+            if self._scheduler is None or evl.isRun(): return await evl.arun(baseDir)
+            await self._scheduler.aacquire(self)
+            try:
+                return await evl.arun(baseDir)
+            finally:
+                self._scheduler.release(self)
+        #end
+
+        await asyncio.gather(*[schedule(evl) for evl in dependGraph if active[evl]],
+                             return_exceptions=True)
+        if any(task.exception() is not None for task in tasks.values()):
+            raise RuntimeError("Evaluations failed.")
+    #end
+
     # run evaluations extracting maximum parallelism
     def _evalFunInParallel(self):
         self._funTime -= time.time()
@@ -157,7 +264,13 @@ class ParallelEvalDriver(DriverBase):
     def _evalJacInParallel(self):
         self._jacTime -= time.time()
 
-        # determine what evaluations are active based on functions
+        self._evalInParallel(self._jacEvalGraph, self._activeJacEvals())
+
+        self._jacTime += time.time()
+    #end
+
+    # determine what gradient evaluations are active based on functions
+    def _activeJacEvals(self):
         active = dict(zip(self._jacEvalGraph.keys(), [False]*len(self._jacEvalGraph)))
 
         for obj in self._objectives:
@@ -175,17 +288,350 @@ class ParallelEvalDriver(DriverBase):
 
         # gradients are not needed for monitor functions
 
-        self._evalInParallel(self._jacEvalGraph, active)
+        return active
+    #end
+
+    # "struct" with the clone of the functions and evaluations used for one design
+    class _BatchDesign:
+        def __init__(self,x,dir,functions,graphs,numGrad,mask,evals,sources):
+            self.x = x
+            self.dir = dir
+            self.functions = functions
+            # the functions of the driver from which "functions" were cloned
+            self.sources = sources
+            self.funGraph, self.jacGraph = graphs
+            self.mask = mask
+            # functions whose gradients are required (the first numGrad)
+            self.numGrad = numGrad
+            self.values = np.full((len(functions),),np.nan)
+            self.gradients = None
+            # 0 values, 1 gradients, 2 finished
+            self.stage = 0
+            self.error = False
+            self.funActive = dict(zip(self.funGraph.keys(),[True]*len(self.funGraph)))
+            self.jacActive = dict(zip(self.jacGraph.keys(),[False]*len(self.jacGraph)))
+            # maps the evaluations of the driver to their clones
+            self.evals = evals
+    #end
+
+    # clone the functions (their variables and evaluations) for the design "x"
+    def _cloneForDesign(self,x,dir,functions,numGrad):
+        memo = {}
+        sources = functions
+        functions = copy.deepcopy(functions,memo)
+
+        # finite differences of the driver's design are not valid for this one
+        for function in functions:
+            if function.hasFiniteDifferences(): function.clearFiniteDifferenceValues()
+
+        # the mask includes all variables, some may not be used by the functions
+        mask = {}
+        startIdx = 0
+        for var in self._variables:
+            endIdx = startIdx+var.getSize()
+            clone = memo.get(id(var),var)
+            if clone is not var: clone.setCurrent(x[startIdx:endIdx]/var.getScale())
+            mask[clone] = startIdx
+            startIdx = endIdx
+        #end
+
+        evals = dict((evl,memo[id(evl)]) for evl in self._getAllEvaluations() if id(evl) in memo)
+        graphs = self._buildEvalGraphs(functions)
+        design = self._BatchDesign(x,dir,functions,graphs,numGrad,mask,evals,sources)
+        for evl in list(design.funGraph.keys())+list(design.jacGraph.keys()):
+            evl.finalize()
+        return design
+    #end
+
+    def evaluateBatch(self,X,gradients=False,maxParallel=None,dirPrefix="BATCH_"):
+        """
+        Evaluate the functions at several designs concurrently, each in its own working
+        directory. The evaluation steps of all designs are started as soon as their
+        dependencies are met, subject to a maximum number of simultaneous evaluations.
+        The current design of the driver is not affected, and the user pre/post
+        processing actions are not executed. Functions with variables that are not written
+        to files (e.g. SharedArrayWriter) require maxParallel=1. The perturbed designs of
+        finite difference gradients are evaluated in sub-directories of each design.
+
+        Parameters
+        ----------
+        X           : 2D array, each row is a design vector (as seen by the optimizer).
+        gradients   : If True, also evaluate the gradients of objectives and constraints.
+        maxParallel : Maximum number of simultaneous evaluations, 0 for no limit, by
+                      default the value set with setEvaluationMode.
+        dirPrefix   : Prefix of the working directory of each design.
+
+        Returns
+        -------
+        Dictionary with "fun", the raw function values with one row per design and one
+        column per function (objectives, equality constraints, inequality constraints,
+        monitors), and if gradients=True, "grad", the gradients of the functions w.r.t.
+        the design vector (indexed by design, function, variable, NaN for monitors).
+        In "SOFT" failure mode, failed evaluations give default values or NaN.
+        """
+        return self._evaluateBatch(X,gradients,maxParallel,dirPrefix)[0]
+    #end
+
+    # implementation of evaluateBatch that also returns the designs, whose directories
+    # are not discarded if "retain" is True (see _retainBatchDesign)
+    def _evaluateBatch(self,X,gradients,maxParallel,dirPrefix,retain=False):
+        X = np.atleast_2d(X)
+        functions = self._getAllFunctions()
+        numGrad = (0,len(functions)-len(self._monitors))[gradients]
+        if maxParallel is None: maxParallel = self._maxParallel
+
+        designs = self._runBatch(X,[functions]*X.shape[0],numGrad,maxParallel,dirPrefix,\
+                                 retain=retain)
+
+        if any(design.error for design in designs) and self._failureMode == "HARD":
+            raise RuntimeError("Evaluations failed.")
+
+        result = {"fun" : np.array([design.values for design in designs])}
+        if gradients:
+            grad = np.full((X.shape[0],len(functions),self._nVar),np.nan)
+            for i, design in enumerate(designs):
+                grad[i,0:numGrad,:] = design.gradients
+            result["grad"] = grad
+        #end
+        return result, designs
+    #end
+
+    # Keep the directory of a batch design with lower "value" than the one currently
+    # retained, if it becomes the current design its results are adopted instead of
+    # evaluating the functions again (e.g. the step accepted by a line search).
+    def _retainBatchDesign(self,design,value):
+        if design.error or self._recycle or \
+           (self._retainedDesign is not None and self._retainedDesign[0] <= value):
+            if not self._keepDesigns: self._storage.discard(design.dir)
+            return
+        #end
+        self._discardRetainedDesign()
+        dir = os.path.join(self._userDir,"BATCH_RETAINED")
+        self._storage.discard(dir)
+        os.rename(design.dir,dir)
+        design.dir = dir
+        self._retainedDesign = (value,design)
+    #end
+
+    def _discardRetainedDesign(self):
+        if self._retainedDesign is None: return
+        self._storage.discard(self._retainedDesign[1].dir)
+        self._retainedDesign = None
+    #end
+
+    # decorates the parent method, a matching retained design becomes the current one
+    def _handleVariableChange(self, x):
+        if not DriverBase._handleVariableChange(self,x): return False
+        if self._retainedDesign is None: return True
+
+        design = self._retainedDesign[1]
+        self._retainedDesign = None
+        if (abs(design.x-x) > np.finfo(float).eps).any():
+            self._storage.discard(design.dir)
+            return True
+        #end
+
+        # the working directory was just created
+        workDir = self._getWorkDir()
+        os.rmdir(workDir)
+        os.rename(design.dir,workDir)
+        for evl, clone in design.evals.items():
+            if clone.isRun() and not clone.isError(): evl.adoptRun(clone,workDir)
+        #end
+        return True
+    #end
+
+    # Evaluate lists of functions at several designs (rows of X), the gradients of the
+    # first "numGrad" functions of each list are also evaluated. Returns the designs.
+    # "callback(i,design)" is called as soon as the i-th design completes. The directories
+    # are numbered by position in X, or by "indices" if given.
+    def _runBatch(self,X,functionLists,numGrad,maxParallel,dirPrefix,callback=None,retain=False,
+                  indices=None):
+        if indices is None: indices = range(X.shape[0])
+
+        # variables that are not written to files (e.g. SharedArrayWriter) are shared by the
+        # copies of the functions, only one evaluation can run at a time
+        if maxParallel != 1 and X.shape[0] > 1:
+            for functions in functionLists:
+                for function in functions:
+                    if all(getattr(var,"usesFiles",lambda: True)() for var in function.getVariables()):
+                        continue
+                    raise RuntimeError("Function '"+function.getName()+"' has variables that are "+\
+                        "not written to files, its designs cannot be evaluated concurrently "+\
+                        "(maxParallel must be 1).")
+                #end
+            #end
+        #end
+
+        designs = []
+        for i, x, functions in zip(indices,X,functionLists):
+            assert x.size == self._nVar, "Wrong size of design vector."
+            dir = os.path.join(self._userDir,dirPrefix+str(i).rjust(3,"0"))
+            self._storage.discard(dir)
+            os.mkdir(dir)
+            designs.append(self._cloneForDesign(x,dir,functions,numGrad))
+        #end
+
+        try:
+            self._evalBatch(designs,maxParallel,callback)
+        finally:
+            if not (self._keepDesigns or retain):
+                for design in designs: self._storage.discard(design.dir)
+        #end
+        return designs
+    #end
+
+    # run the evaluations of all designs and retrieve the results as they complete
+    def _evalBatch(self,designs,maxParallel,callback=None):
+        slots = -1
+        # evaluations can be in both graphs (e.g. the same run for values and gradients)
+        numRunning = lambda: sum(self._numRunning(design.funGraph.keys()|design.jacGraph.keys())\
+                                 for design in designs)
+        while True:
+            if maxParallel > 0: slots = max(0,maxParallel-numRunning())
+            ready = 0
+            for design in designs:
+                ready += self._numReady(design.funGraph,design.funActive)+\
+                         self._numReady(design.jacGraph,design.jacActive)
+            slots = self._requestSlots(slots,ready)
+            allDone = True
+            for i, design in enumerate(designs):
+                if design.stage == 2: continue
+                allDone = False
+
+                if design.stage == 0:
+                    allRun, err, slots = self._evalSweep(design.funGraph,design.funActive,slots,\
+                                                         design.dir)
+                    design.error |= err
+                    if not allRun: continue
+                    self._fetchBatchValues(design)
+                    if design.numGrad == 0:
+                        design.stage = 2
+                        if callback is not None: callback(i,design)
+                        continue
+                    #end
+                    design.stage = 1
+                    for function in design.functions[0:design.numGrad]:
+                        for evl in function.getGradientEvalChain():
+                            design.jacActive[evl] = True
+                    #end
+                #end
+
+                allRun, err, slots = self._evalSweep(design.jacGraph,design.jacActive,slots,\
+                                                     design.dir)
+                design.error |= err
+                if not allRun: continue
+                self._fetchBatchGradients(design,maxParallel)
+                design.stage = 2
+                if callback is not None: callback(i,design)
+            #end
+            ExecutorBase.flushAll()
+            self._settleSlots(numRunning())
+            if allDone: break
+            time.sleep(self._waitTime)
+        #end
+    #end
+
+    def _fetchBatchValues(self,design):
+        for i, function in enumerate(design.functions):
+            try:
+                design.values[i] = function.getValue(design.dir)
+            except:
+                design.error = True
+                if function.hasDefaultValue() and self._failureMode == "SOFT":
+                    design.values[i] = function.getDefaultValue()
+            #end
+        #end
+    #end
+
+    def _fetchBatchGradients(self,design,maxParallel):
+        # the perturbed designs are evaluated in sub-directories of the design
+        functions = design.functions[0:design.numGrad]
+        fdIdx = [i for i, fun in enumerate(functions) if fun.hasFiniteDifferences()]
+        if fdIdx and not design.error:
+            dirPrefix = os.path.join(os.path.relpath(design.dir,self._userDir),"FD_")
+            fdDesigns = self._runFiniteDifferences(design.x,design.mask,[functions[i] for i in fdIdx],\
+                [design.sources[i] for i in fdIdx],design.values[fdIdx],dirPrefix,maxParallel)
+            design.error |= any(fdDesign.error for fdDesign in fdDesigns)
+        #end
+
+        design.gradients = np.full((design.numGrad,self._nVar),np.nan)
+        for i, function in enumerate(design.functions[0:design.numGrad]):
+            try:
+                design.gradients[i,:] = function.getGradient(design.mask,design.dir)/self._varScales
+            except:
+                design.error = True
+            #end
+        #end
+    #end
+
+    # Evaluate the perturbed designs needed by functions with finite difference gradients.
+    def _evalFiniteDifferences(self):
+        # only the functions whose gradients are needed, as in "_evalJacInParallel"
+        functions = [obj.function for obj in self._objectives+self._constraintsEQ]
+        for (obj,f) in zip(self._constraintsGT,self._gtval):
+            if f < 0.0 or not self._asNeeded: functions.append(obj.function)
+        functions = [fun for fun in functions if fun.hasFiniteDifferences()]
+        if not functions: return
+
+        self._jacTime -= time.time()
+        values = [fun.getValue(self._getWorkDir()) for fun in functions]
+
+        # in sequential mode the perturbed designs are also evaluated one at a time
+        maxParallel = (1,self._maxParallel)[self._parallelEval]
+        designs = self._runFiniteDifferences(self._x,self._variableStartMask,functions,functions,\
+                                             values,"FD_",maxParallel)
 
         self._jacTime += time.time()
+
+        if any(design.error for design in designs) and self._failureMode == "HARD":
+            raise RuntimeError("Evaluations failed.")
+    #end
+
+    # Evaluate the designs perturbed around "x" (whose variables start at the offsets in
+    # "mask") needed by "functions", and set their finite difference gradients from the
+    # unperturbed "values". The perturbed designs are evaluated with clones of "sources",
+    # the driver's functions from which "functions" may have been cloned. Returns the designs.
+    def _runFiniteDifferences(self,x0,mask,functions,sources,values,dirPrefix,maxParallel):
+        # functions with the same perturbations share the perturbed designs
+        designIdx = {}
+        X = []
+        funLists = []
+        locations = []
+        for fun, src in zip(functions,sources):
+            loc = []
+            for perturbation in fun.getPerturbations():
+                key = tuple((id(var),i,dx) for var,i,dx in perturbation)
+                if key not in designIdx:
+                    x = np.array(x0)
+                    for var,i,dx in perturbation:
+                        j = mask[var]+i
+                        x[j] += dx*self._varScales[j]
+                    #end
+                    designIdx[key] = len(X)
+                    X.append(x)
+                    funLists.append([])
+                #end
+                k = designIdx[key]
+                if src not in funLists[k]: funLists[k].append(src)
+                loc.append((k,funLists[k].index(src)))
+            #end
+            locations.append(loc)
+        #end
+
+        designs = self._runBatch(np.array(X),funLists,0,maxParallel,dirPrefix)
+
+        for fun, f0, loc in zip(functions,values,locations):
+            fun.setFiniteDifferenceValues(f0,[designs[k].values[j] for k,j in loc])
+
+        return designs
     #end
 
     # runs a pre/post processing user action
     def _runAction(self, action):
         if action is None: return
-        os.chdir(self._userDir)
         if isinstance(action,str):
-            sp.call(action,shell=True)
+            sp.call(action,shell=True,cwd=self._userDir)
         else:
             action()
         #end
@@ -201,8 +647,6 @@ class ParallelEvalDriver(DriverBase):
 
         self._runAction(self._userPreProcessFun)
 
-        os.chdir(self._workDir)
-
         if self._parallelEval:
             try:
                 self._evalFunInParallel()
@@ -210,13 +654,19 @@ class ParallelEvalDriver(DriverBase):
                 if self._failureMode == "HARD": raise
         #end
 
+        self._fetchFunctionValues()
+        return True
+    #end
+
+    # Retrieve and store the function values after shifting and scaling.
+    def _fetchFunctionValues(self):
         self._funEval += 1
         self._funTime -= time.time()
 
         def fetchValues(dst, src):
             for i, obj in enumerate(src):
                 try:
-                    dst[i] = obj.function.getValue()
+                    dst[i] = obj.function.getValue(self._getWorkDir())
                 except:
                     if obj.function.hasDefaultValue() and self._failureMode == "SOFT":
                         dst[i] = obj.function.getDefaultValue()
@@ -248,9 +698,8 @@ class ParallelEvalDriver(DriverBase):
 
         self._runAction(self._userPostProcessFun)
 
-        os.chdir(self._userDir)
         self._funReady = True
-        return True
+        self._recordFootprint()
     #end
 
     # Evaluates all gradients in parallel execution mode, otherwise
@@ -265,7 +714,7 @@ class ParallelEvalDriver(DriverBase):
 
         self._runAction(self._userPreProcessGrad)
 
-        os.chdir(self._workDir)
+        self._evalFiniteDifferences()
 
         # evaluate everything, either in parallel or sequentially,
         # in the latter case the evaluations occur when retrieving the values
@@ -274,10 +723,60 @@ class ParallelEvalDriver(DriverBase):
             self._runAction(self._userPostProcessGrad)
         #end
 
-        os.chdir(self._userDir)
         self._jacReady = True
         self._jacEval += 1
+        self._recordFootprint()
         return True
     #end
-#end
 
+    # asyncio versions of _evaluateFunctions and _evaluateGradients, the evaluations
+    # always run concurrently (limited by "maxParallel") whatever the evaluation mode
+    async def _aevaluateFunctions(self, x):
+        self._handleVariableChange(x)
+
+        # lazy evaluation
+        if self._funReady: return False
+
+        if self._funEvalGraph is None:
+            self._funEvalGraph, self._jacEvalGraph = self._buildEvalGraphs()
+
+        self._runAction(self._userPreProcessFun)
+
+        self._funTime -= time.time()
+        try:
+            await self._aevalGraph(self._funEvalGraph,dict.fromkeys(self._funEvalGraph,True))
+        except:
+            if self._failureMode == "HARD": raise
+        finally:
+            self._funTime += time.time()
+        #end
+
+        self._fetchFunctionValues()
+        return True
+    #end
+
+    async def _aevaluateGradients(self, x):
+        await self._aevaluateFunctions(x)
+
+        # lazy evaluation
+        if self._jacReady: return False
+
+        self._runAction(self._userPreProcessGrad)
+
+        # perturbed designs are evaluated as a batch without blocking the event loop
+        await asyncio.get_running_loop().run_in_executor(None,self._evalFiniteDifferences)
+
+        self._jacTime -= time.time()
+        try:
+            await self._aevalGraph(self._jacEvalGraph,self._activeJacEvals())
+        finally:
+            self._jacTime += time.time()
+        #end
+        self._runAction(self._userPostProcessGrad)
+
+        self._jacReady = True
+        self._jacEval += 1
+        self._recordFootprint()
+        return True
+    #end
+#end
@@ -0,0 +1,251 @@
+#  Copyright 2019-2025, FADO Contributors (cf. AUTHORS.md)
+#
+#  This file is part of FADO.
+#
+#  FADO is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Lesser General Public License as published
+#  by the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  FADO is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public License
+#  along with FADO.  If not, see <https://www.gnu.org/licenses/>.
+
+import os
+import math
+import time
+import asyncio
+import threading
+
+
+class EvaluationScheduler:
+    """
+    Shares a budget of evaluation slots (e.g. cores) between the drivers of a process,
+    each running evaluation holds one slot. Drivers register with a priority that sets
+    their fair share of the slots (proportional to the priority of the drivers that are
+    using or waiting for slots). Idle slots are given to whoever asks for them, the
+    share only matters when drivers compete. Acquiring and releasing is thread-safe.
+
+    Parameters
+    ----------
+    slots : Number of slots, by default the number of CPUs.
+
+    See also
+    --------
+    getScheduler, for the process-wide scheduler, and ParallelEvalDriver.setScheduler.
+    """
+    def __init__(self,slots=None):
+        if slots is None: slots = os.cpu_count() or 1
+        assert slots > 0, "The number of slots must be positive."
+        self._slots = slots
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        # per client: priority, slots used, unmet demand, threads/tasks waiting, slot-time
+        self._priority = {}
+        self._used = {}
+        self._demand = {}
+        self._waiters = {}
+        self._slotTime = {}
+        self._asyncWaiters = []
+        self.resetStats()
+    #end
+
+    def getNumSlots(self):
+        return self._slots
+
+    def register(self,client,priority=1.0):
+        """Register a client (usually a driver) or change its priority."""
+        assert priority > 0, "The priority must be positive."
+        with self._lock:
+            self._priority[client] = priority
+            for data in (self._used,self._demand,self._waiters,self._slotTime):
+                data.setdefault(client,0)
+        #end
+    #end
+
+    def unregister(self,client):
+        """Remove a client, the slots it holds are released."""
+        with self._lock:
+            self._account()
+            for data in (self._priority,self._used,self._demand,self._waiters,self._slotTime):
+                data.pop(client,None)
+            self._notify()
+        #end
+    #end
+
+    def tryAcquire(self,client,num=1):
+        """
+        Acquire up to "num" slots without waiting, returns the number acquired.
+        The shortfall is recorded as the demand of the client until the next call,
+        this is how clients that poll get their fair share.
+        """
+        with self._lock:
+            if client not in self._priority: raise KeyError("Client is not registered.")
+            granted = min(num,self._grantable(client))
+            self._take(client,granted)
+            # less demand may free slots reserved for this client
+            if num-granted < self._demand[client]: self._notify()
+            self._demand[client] = num-granted
+            return granted
+        #end
+    #end
+
+    def acquire(self,client,timeout=None):
+        """Wait for one slot, returns False if "timeout" (seconds) expires."""
+        with self._lock:
+            if client not in self._priority: raise KeyError("Client is not registered.")
+            self._waiters[client] += 1
+            try:
+                if not self._cond.wait_for(lambda: self._grantable(client) > 0,timeout):
+                    return False
+                self._take(client,1)
+                return True
+            finally:
+                self._waiters[client] -= 1
+            #end
+        #end
+    #end
+
+    async def aacquire(self,client):
+        """Coroutine that waits for one slot without blocking the event loop."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if client not in self._priority: raise KeyError("Client is not registered.")
+            self._waiters[client] += 1
+        #end
+        try:
+            while True:
+                with self._lock:
+                    if self._grantable(client) > 0:
+                        self._take(client,1)
+                        return
+                    #end
+                    wakeup = loop.create_future()
+                    self._asyncWaiters.append((loop,wakeup))
+                #end
+                await wakeup
+            #end
+        finally:
+            with self._lock:
+                if client in self._waiters: self._waiters[client] -= 1
+        #end
+    #end
+
+    def release(self,client,num=1):
+        """Release "num" slots held by the client."""
+        if num <= 0: return
+        with self._lock:
+            if client not in self._used: return
+            self._account()
+            self._used[client] = max(0,self._used[client]-num)
+            self._notify()
+        #end
+    #end
+
+    def getStats(self):
+        """
+        Returns a dictionary with the number of "slots", those "inUse", the "peak"
+        usage, the "elapsed" time and average "utilization" (fraction of the slots busy)
+        since the last resetStats, and per client ("clients", indexed by client) the
+        "priority", slots "inUse", "demand" and "utilization" (fraction of all slots).
+        """
+        with self._lock:
+            self._account()
+            elapsed = max(time.time()-self._start,1e-12)
+            clients = {}
+            for client in self._priority:
+                clients[client] = {"priority" : self._priority[client],
+                                   "inUse" : self._used[client],
+                                   "demand" : self._demand[client]+self._waiters[client],
+                                   "utilization" : self._slotTime[client]/(self._slots*elapsed)}
+            #end
+            return {"slots" : self._slots, "inUse" : sum(self._used.values()),
+                    "peak" : self._peak, "elapsed" : elapsed,
+                    "utilization" : self._busyTime/(self._slots*elapsed),
+                    "clients" : clients}
+        #end
+    #end
+
+    def resetStats(self):
+        """Restart the accumulation of utilization statistics."""
+        with self._lock:
+            self._start = time.time()
+            self._last = self._start
+            self._busyTime = 0.0
+            self._peak = sum(self._used.values())
+            for client in self._slotTime: self._slotTime[client] = 0.0
+        #end
+    #end
+
+    # The methods below assume the lock is held.
+
+    # accumulate slot-time since the last change
+    def _account(self):
+        now = time.time()
+        dt = now-self._last
+        self._last = now
+        for client, used in self._used.items():
+            self._slotTime[client] += used*dt
+            self._busyTime += used*dt
+        #end
+    #end
+
+    def _take(self,client,num):
+        if num <= 0: return
+        self._account()
+        self._used[client] += num
+        self._peak = max(self._peak,sum(self._used.values()))
+    #end
+
+    # wake up everyone waiting, they check again if they can take slots
+    def _notify(self):
+        self._cond.notify_all()
+        for (loop,wakeup) in self._asyncWaiters:
+            loop.call_soon_threadsafe(_wakeup,wakeup)
+        self._asyncWaiters = []
+    #end
+
+    # number of slots the client may take now, free slots are reserved for the clients
+    # that want them and are below their fair share
+    def _grantable(self,client):
+        free = self._slots-sum(self._used.values())
+        if free <= 0: return 0
+
+        wants = lambda c: self._demand[c]+self._waiters[c]
+        competing = [c for c in self._priority if c is client or self._used[c] > 0 or wants(c) > 0]
+        total = sum(self._priority[c] for c in competing)
+        share = lambda c: math.ceil(self._slots*self._priority[c]/total)
+
+        reserved = 0
+        for c in competing:
+            if c is not client and wants(c) > 0 and self._used[c] < share(c):
+                reserved += min(wants(c),share(c)-self._used[c])
+        #end
+        if reserved == 0: return free
+
+        return max(0,min(free,max(share(client)-self._used[client],free-reserved)))
+    #end
+#end
+
+
+def _wakeup(future):
+    if not future.done(): future.set_result(None)
+
+
+_defaultScheduler = None
+_defaultLock = threading.Lock()
+
+def getScheduler(slots=None):
+    """
+    Returns the process-wide EvaluationScheduler, it is created on the first call
+    with "slots" (by default the number of CPUs), which is ignored afterwards.
+    """
+    global _defaultScheduler
+    with _defaultLock:
+        if _defaultScheduler is None: _defaultScheduler = EvaluationScheduler(slots)
+    return _defaultScheduler
+#end
@@ -15,7 +15,6 @@
 #  You should have received a copy of the GNU Lesser General Public License
 #  along with FADO.  If not, see <https://www.gnu.org/licenses/>.
 
-import os
 import time
 import numpy as np
 from .constrained_optim_driver import ConstrainedOptimizationDriver
@@ -87,11 +86,9 @@ class ScipyDriver(ConstrainedOptimizationDriver):
         try:
             self._evaluateGradients(x)
 
-            os.chdir(self._workDir)
-
             self._grad_f[()] = 0.0
             for obj in self._objectives:
-                self._grad_f += obj.function.getGradient(self._variableStartMask) * obj.scale
+                self._grad_f += obj.function.getGradient(self._variableStartMask,self._getWorkDir()) * obj.scale
             self._grad_f /= self._varScales
 
             # keep copy of result to use as fallback on next iteration if needed
@@ -105,7 +102,6 @@ class ScipyDriver(ConstrainedOptimizationDriver):
             self._runAction(self._userPostProcessGrad)
 
         self._jacTime += time.time()
-        os.chdir(self._userDir)
 
         return self._grad_f
     #end
@@ -129,8 +125,6 @@ class ScipyDriver(ConstrainedOptimizationDriver):
         try:
             self._evaluateGradients(x)
 
-            os.chdir(self._workDir)
-
             mask = self._variableStartMask
 
             if idx < len(self._constraintsEQ):
@@ -142,7 +136,7 @@ class ScipyDriver(ConstrainedOptimizationDriver):
             #end
 
             if f < 0.0 or not self._asNeeded:
-                self._jac_g[:,idx] = con.function.getGradient(mask) * con.scale / self._varScales
+                self._jac_g[:,idx] = con.function.getGradient(mask,self._getWorkDir()) * con.scale / self._varScales
             else:
                 self._jac_g[:,idx] = 0.0
             #end
@@ -158,7 +152,6 @@ class ScipyDriver(ConstrainedOptimizationDriver):
             self._runAction(self._userPostProcessGrad)
 
         self._jacTime += time.time()
-        os.chdir(self._userDir)
 
         return self._jac_g[:,idx]
     #end
@@ -0,0 +1,235 @@
+#  Copyright 2019-2025, FADO Contributors (cf. AUTHORS.md)
+#
+#  This file is part of FADO.
+#
+#  FADO is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Lesser General Public License as published
+#  by the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  FADO is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public License
+#  along with FADO.  If not, see <https://www.gnu.org/licenses/>.
+
+import numpy as np
+from .exterior_penalty import ExteriorPenaltyDriver
+
+
+class SurrogateTrustRegionDriver(ExteriorPenaltyDriver):
+    """
+    Exterior penalty driver with a built-in surrogate-assisted trust-region optimizer.
+    A gradient-enhanced quadratic model of the penalized function is fitted to the
+    evaluated history (the curvature is only modeled in the subspace spanned by the
+    history, which keeps the cost low for many variables) and minimized within the
+    trust region and the variable bounds. The functions are only evaluated to accept
+    or reject the steps, and the gradients only at accepted points.
+    The parameters are the same as for ExteriorPenaltyDriver.
+    """
+    def __init__(self, tol, freq=40, rini=8, rmax=1024, factorUp=4, factorDown=0.5):
+        ExteriorPenaltyDriver.__init__(self, tol, freq, rini, rmax, factorUp, factorDown)
+        # (x, f, g) of the evaluated points, g is None for rejected points
+        self._history = []
+        self._modelStale = False
+    #end
+
+    def update(self,paramsIfFeasible=False):
+        ExteriorPenaltyDriver.update(self,paramsIfFeasible)
+        # the penalized function changed, the history is no longer valid
+        self._modelStale = True
+    #end
+
+    def optimize(self,x=None,options={}):
+        """
+        Run the trust-region optimization.
+
+        Parameters
+        ----------
+        x       : The starting point, by default the initial design.
+        options : Dictionary of options:
+                  "ftol" function-based tolerance [1e-6];
+                  "gtol" norm of projected gradient-based tolerance [1e-5];
+                  "xtol" minimum trust region radius [1e-8];
+                  "maxiter" maximum number of iterations [100];
+                  "disp" True to print messages [False];
+                  "radius" initial trust region radius (infinity norm) [1.0];
+                  "maxhist" maximum number of history points used by the model [10];
+                  "eta" minimum ratio of actual to predicted reduction to accept steps [0.1].
+
+        Returns
+        -------
+        Dictionary with the same fields as fletcherReeves, "x", "fun", "jac", "nit", "nfev",
+        "njev", and "success", plus "evalsPerImprovement", the number of function and
+        gradient evaluations per unit of reduction of the penalized function.
+        """
+        ftol = options.get("ftol",1e-6)
+        gtol = options.get("gtol",1e-5)
+        xtol = options.get("xtol",1e-8)
+        maxiter = options.get("maxiter",100)
+        verbose = options.get("disp",False)
+        radius = options.get("radius",1.0)
+        maxhist = options.get("maxhist",10)
+        eta = options.get("eta",0.1)
+
+        if x is None: x = self.getInitial()
+        lb = self.getLowerBound()
+        ub = self.getUpperBound()
+        x = np.clip(np.array(x,float),lb,ub)
+
+        if verbose:
+            headerLine = ""
+            for data in ["ITER","FUN EVAL","GRAD EVAL","RADIUS","RATIO","GRAD EPS","FUN VAL"]:
+                headerLine += data.rjust(13)
+            logFormat = "{:>13}"*3+"{:>13.6g}"*4
+            print("\n"+"*"*30+" Surrogate Trust-Region Method "+"*"*30+"\n")
+            print(headerLine)
+        #end
+
+        # initialize
+        funEval0 = self._funEval
+        jacEval0 = self._jacEval
+        self._modelStale = False
+        f = self.fun(x)
+        g = np.array(self.grad(x))
+        self._history = [(x.copy(),f,g.copy())]
+        f0 = f
+        success = False
+
+        for i in range(maxiter):
+            # after penalty/parameter updates the model is rebuilt from the current point
+            if self._modelStale:
+                self._modelStale = False
+                f = self.fun(x)
+                g = np.array(self.grad(x))
+                self._history = [(x.copy(),f,g.copy())]
+            #end
+
+            # projected gradient
+            gnorm = max(abs(np.clip(x-g,lb,ub)-x))
+            if gnorm < gtol:
+                success = True
+                break
+            #end
+
+            # minimize the model within the trust region
+            Q, M = self._fitModel(x,f,g,maxhist)
+            s, pred = self._solveModel(Q,M,g,np.maximum(lb-x,-radius),np.minimum(ub-x,radius))
+            step = max(abs(s))
+            if pred <= 0.0 or step < xtol:
+                success = True
+                break
+            #end
+
+            # evaluate the candidate
+            f_new = self.fun(x+s)
+            rho = (f-f_new)/pred
+            f_old = f
+            if rho >= eta:
+                x = x+s
+                f = f_new
+                g = np.array(self.grad(x))
+                self._history.append((x.copy(),f,g.copy()))
+            else:
+                self._history.append((x+s,f_new,None))
+            #end
+
+            # update the radius
+            if rho < 0.25:
+                radius = 0.5*step
+            elif rho > 0.75 and step > 0.99*radius:
+                radius *= 2.0
+
+            # log
+            if verbose:
+                if i%10==0 and i>0: print(headerLine)
+                logData = [i+1, self._funEval-funEval0, self._jacEval-jacEval0, radius, rho, gnorm, f]
+                print(logFormat.format(*logData))
+            #end
+
+            # convergence criteria
+            if radius < xtol or (rho >= eta and f_old-f < ftol):
+                success = True
+                break
+            #end
+        #end
+
+        nfev = self._funEval-funEval0
+        njev = self._jacEval-jacEval0
+        evalsPerImprovement = np.inf
+        if f0 > f: evalsPerImprovement = (nfev+njev)/(f0-f)
+        if verbose:
+            print("\nFunction evaluations: "+str(nfev)+"    Gradient evaluations: "+str(njev))
+            print("Evaluations per unit of improvement: "+str(evalsPerImprovement)+"\n")
+        #end
+
+        result = {"x" : x, "fun" : f, "jac" : g, "nit" : i+1, "nfev" : nfev, "njev" : njev,
+                  "success" : success, "evalsPerImprovement" : evalsPerImprovement}
+        return result
+    #end
+
+    # Fit the quadratic model f + g's + 0.5 (Q's)' M (Q's) to the history around "x",
+    # Q is an orthonormal basis of the history steps, M is symmetric.
+    def _fitModel(self,x,f,g,maxhist):
+        points = [p for p in self._history[-maxhist-1:] if np.any(p[0] != x)][-maxhist:]
+        if not points: return (np.zeros((x.size,0)), np.zeros((0,0)))
+
+        S = np.array([p[0]-x for p in points]).transpose()
+        U, sv, _ = np.linalg.svd(S,full_matrices=False)
+        Q = U[:,sv > 1e-8*sv[0]]
+        Z = Q.transpose().dot(S)
+        r = Q.shape[1]
+
+        # unknowns are the upper triangle of M, each basis matrix E is symmetric
+        basis = []
+        for k in range(r):
+            for l in range(k,r):
+                E = np.zeros((r,r))
+                E[k,l] = 1.0
+                E[l,k] = 1.0
+                basis.append(E)
+            #end
+        #end
+
+        # gradient differences (r equations per point) and values (one per point)
+        rows = []
+        rhs = []
+        for (p,z) in zip(points,Z.transpose()):
+            if p[2] is not None:
+                rows += np.array([E.dot(z) for E in basis]).transpose().tolist()
+                rhs += Q.transpose().dot(p[2]-g).tolist()
+            #end
+            # scaled by the step length to be comparable with the gradient equations
+            zn = np.linalg.norm(z)
+            rows.append([0.5*z.dot(E.dot(z))/zn for E in basis])
+            rhs.append((p[1]-f-g.dot(p[0]-x))/zn)
+        #end
+
+        coeffs = np.linalg.lstsq(np.array(rows),np.array(rhs),rcond=None)[0]
+        M = sum(c*E for (c,E) in zip(coeffs,basis))
+        return (Q, M)
+    #end
+
+    # Minimize the model within [lo,hi] by projected gradient,
+    # returns the step and the predicted reduction.
+    @staticmethod
+    def _solveModel(Q,M,g,lo,hi,maxiter=500):
+        model = lambda s: g.dot(s)+0.5*Q.transpose().dot(s).dot(M.dot(Q.transpose().dot(s)))
+        L = 0.0
+        if M.size > 0: L = max(abs(np.linalg.eigvalsh(M)))
+        alpha = 1.0/max(L,max(abs(g))/max(hi-lo),1e-300)
+
+        s = np.zeros(g.shape)
+        for i in range(maxiter):
+            s_new = np.clip(s-alpha*(g+Q.dot(M.dot(Q.transpose().dot(s)))),lo,hi)
+            if max(abs(s_new-s)) < 1e-9*max(hi-lo):
+                s = s_new
+                break
+            #end
+            s = s_new
+        #end
+        return (s, -model(s))
+    #end
+#end
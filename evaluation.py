@@ -16,13 +16,180 @@
 #  along with FADO.  If not, see <https://www.gnu.org/licenses/>.
 
 import os
+import glob
+import time
+import gzip
+import errno
 import shutil
+import asyncio
+import tempfile
+import threading
 import subprocess as sp
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from .executors import getDefaultExecutor, ResidentSolver, PythonPool
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# ioctl request to clone a file on Linux (copy-on-write "reflink")
+_FICLONE = 0x40049409
+
+
+def _reflinkOrCopy(src,dst):
+    """Clone src into dst if the file system allows it, otherwise copy it (in kernel space
+    if possible). Returns the number of bytes copied."""
+    size = os.path.getsize(src)
+    with open(src,"rb") as fsrc, open(dst,"wb") as fdst:
+        if fcntl is not None:
+            try:
+                fcntl.ioctl(fdst.fileno(),_FICLONE,fsrc.fileno())
+                shutil.copymode(src,dst)
+                return 0
+            except OSError:
+                pass
+        #end
+        if hasattr(os,"copy_file_range"):
+            try:
+                copied = 0
+                while copied < size:
+                    n = os.copy_file_range(fsrc.fileno(),fdst.fileno(),size-copied)
+                    if n == 0: break
+                    copied += n
+                #end
+                if copied == size:
+                    shutil.copymode(src,dst)
+                    return size
+                #end
+            except OSError:
+                pass
+            #end
+            fsrc.seek(0)
+            fdst.seek(0)
+            fdst.truncate()
+        #end
+        shutil.copyfileobj(fsrc,fdst)
+    #end
+    shutil.copymode(src,dst)
+    return size
+#end
+
+
+def _hardlinkOrCopy(src,dst):
+    """Hard-link src to dst, falling back to a copy (e.g. across file systems).
+    Returns the number of bytes copied."""
+    try:
+        os.link(src,dst)
+        return 0
+    except OSError as err:
+        if err.errno not in (errno.EXDEV,errno.EPERM,errno.EMLINK,errno.ENOTSUP): raise
+    #end
+    shutil.copy(src,dst)
+    return os.path.getsize(src)
+#end
+
+
+def _symlink(src,dst):
+    os.symlink(src,dst)
+    return 0
+#end
+
+
+def _copy(src,dst):
+    shutil.copy(src,dst)
+    return os.path.getsize(src)
+#end
+
+
+# copies back the files of a run that match the patterns
+def _syncBack(src,dst,patterns):
+    for pattern in patterns:
+        for file in glob.glob(os.path.join(src,pattern)):
+            if not os.path.isfile(file): continue
+            target = os.path.join(dst,os.path.relpath(file,src))
+            os.makedirs(os.path.dirname(target),exist_ok=True)
+            shutil.copy2(file,target)
+        #end
+    #end
+#end
+
+
+class _RingCapture:
+    """
+    Reads a pipe in a background thread keeping only the last "maxBytes" in memory,
+    and optionally streaming everything to a compressed (gzip) file.
+    If "pipe" is None the data is fed by an asyncio stream instead, see afeed.
+    """
+    def __init__(self,pipe,maxBytes,compressedFile=None):
+        self._pipe = pipe
+        self._maxBytes = maxBytes
+        self._chunks = deque()
+        self._size = 0
+        self._gzFile = compressedFile
+        self._gz = None
+        if compressedFile is not None: self._gz = gzip.open(compressedFile,"wb",compresslevel=1)
+        self._thread = None
+        if pipe is not None:
+            self._thread = threading.Thread(target=self._read,daemon=True)
+            self._thread.start()
+        #end
+    #end
+
+    def _append(self,data):
+        if self._gz is not None: self._gz.write(data)
+        self._chunks.append(data)
+        self._size += len(data)
+        while self._chunks and self._size-len(self._chunks[0]) >= self._maxBytes:
+            self._size -= len(self._chunks.popleft())
+    #end
+
+    def _read(self):
+        try:
+            while True:
+                data = self._pipe.read1(65536)
+                if not data: break
+                self._append(data)
+            #end
+        finally:
+            self._pipe.close()
+            if self._gz is not None: self._gz.close()
+        #end
+    #end
+
+    async def afeed(self,reader):
+        """Read an asyncio stream until EOF."""
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data: break
+                self._append(data)
+            #end
+        finally:
+            if self._gz is not None: self._gz.close()
+        #end
+    #end
+
+    def persist(self,file,everything):
+        """Write the tail to "file", keep the compressed file only if "everything" is
+        True, returns the number of bytes written to disk."""
+        if self._thread is not None: self._thread.join()
+        with open(file,"wb") as f:
+            if self._maxBytes > 0: f.write(b"".join(self._chunks)[-self._maxBytes:])
+        #end
+        size = os.path.getsize(file)
+        if self._gzFile is not None:
+            if everything: size += os.path.getsize(self._gzFile)
+            else: os.remove(self._gzFile)
+        #end
+        return size
+    #end
+#end
 
 
 class ExternalRun:
     """
-    Defines the execution of an external code (managed via Popen).
+    Defines the execution of an external code (launched by an executor, by default via Popen).
     A lazy execution model is used, once run, a new process will not be started
     until the "lazy" flags are explicitly cleared via "finalize()".
 
@@ -31,13 +198,20 @@ class ExternalRun:
     dir         : The subdirectory within which the command will be run.
     command     : The shell command used to create the external process.
     useSymLinks : If set to True, symbolic links are used for "data" files instead of copies.
+                  This is the default staging mode of the data files (see addData).
     """
+    _STAGING_MODES = {"copy" : _copy, "symlink" : _symlink,
+                      "hardlink" : _hardlinkOrCopy, "reflink" : _reflinkOrCopy}
+
     def __init__(self,dir,command,useSymLinks=False):
         self._dataFiles = []
         self._dataFilesDestination = []
+        self._dataFilesStaging = []
         self._confFiles = []
-        self._expectedFiles = []
+        self._expectedNames = []
         self._workDir = dir
+        self._baseDir = None
+        self._runDir = dir
         self._command = command
         self._symLinks = useSymLinks
         self._maxTries = 1
@@ -47,29 +221,63 @@ class ExternalRun:
         self._parameters = []
         self._stdout = None
         self._stderr = None
+        self._recycle = False
+        self._isStaged = False
+        self._keptOutputs = []
+        self._stagedBytes = 0
+        self._scratch = None
+        self._syncFiles = []
+        self._downstreamFiles = []
+        self._syncJob = None
+        self._capture = "file"
+        self._captureBytes = 0
+        self._captureCompress = False
+        self._rings = None
+        self._ringTasks = None
+        self._outputBytes = 0
+        self._executor = None
         self.finalize()
 
+    # runtime state is not copied, e.g. when cloning the run for other designs
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for key in ("_process","_stdout","_stderr","_rings","_ringTasks","_syncJob"):
+            state[key] = None
+        state["_runDir"] = self._workDir
+        state["_isStaged"] = False
+        return state
+    #end
+
     def _addAbsoluteFile(self,file,flist):
         file = os.path.abspath(file)
         if not os.path.isfile(file):
             raise ValueError("File '"+file+"' not found.")
         flist.append(file)
 
-    def addData(self,file,location="auto",destination=None):
+    def addData(self,file,location="auto",destination=None,staging=None):
         """
         Adds a "data" file to the run, an immutable dependency of the process.
 
         Parameters
         ----------
         file        : Path to the file.
-        location    : Type of path, "relative" (to the parent of "dir"), "absolute" (the path
+        location    : Type of path, "relative" (to the parent of "dir", i.e. the base directory
+                     given to initialize), "absolute" (the path
                      is immediately converted to an absolute path, the file must exist),
                      or "auto" (tries "absolute" first, falls back to "relative").
         destination : Filename to be set at the destination. Discards any additional file path.
                       The default destination is the regular filename (i.e. "file").
+        staging     : How the file is placed in the subdirectory, "copy", "symlink", "hardlink"
+                      (falls back to copy across file systems), or "reflink" (copy-on-write clone,
+                      falls back to a kernel-space copy and then to a regular copy).
+                      The default is "symlink" or "copy" depending on "useSymLinks".
         """
+        if staging is None: staging = ("copy","symlink")[self._symLinks]
+        if staging not in self._STAGING_MODES:
+            raise ValueError("Unknown staging mode '"+str(staging)+"'.")
         if destination is None: destination = file
         self._dataFilesDestination.append(os.path.basename(destination))
+        self._dataFilesStaging.append(staging)
 
         if location == "relative":
             self._dataFiles.append(file)
@@ -98,7 +306,77 @@ class ExternalRun:
     def addExpected(self,file):
         """Add an expected (output) file of the run, the presence of all expected
         files in the working subdirectory indicates that the run succeeded."""
-        self._expectedFiles.append(os.path.join(self._workDir,file))
+        self._expectedNames.append(file)
+
+    def addKeptOutput(self,pattern):
+        """
+        Add a (glob) pattern of output files (e.g. restart files) that survive when the
+        subdirectory is recycled. Everything else that is not a data file is deleted
+        before the run is repeated, expected files are always deleted.
+        """
+        self._keptOutputs.append(pattern)
+
+    def setRecycle(self,recycle=True):
+        """
+        Set whether the subdirectory is recycled between initializations, rather than
+        being created anew. In recycle mode absolute data files (immutable) and symbolic
+        links are staged only once, configuration files are copied every time, and all other
+        files are deleted unless declared via addKeptOutput. The parent directory must not
+        change, and the subdirectory must not be shared with other runs.
+        """
+        self._recycle = recycle
+        self._isStaged = False
+
+    def setScratchDirectory(self,path):
+        """
+        Run the process in a unique subdirectory of "path", e.g. a node-local file system
+        such as /dev/shm, instead of the working subdirectory. Only the expected files,
+        the files declared via addSyncBack, and stdout/stderr, are copied back to the
+        working subdirectory. The copy takes place in the background, the run is only
+        considered finished once it completes. The command must not depend on paths relative
+        to the working subdirectory. In recycle mode the scratch subdirectory is reused
+        (and not deleted). Use path=None to disable.
+        """
+        if path is not None: path = os.path.abspath(path)
+        self._scratch = path
+        self._isStaged = False
+
+    def addSyncBack(self,pattern):
+        """Add a (glob) pattern of files to copy back from the scratch directory, in addition
+        to those consumed by functions and other runs, which drivers determine automatically
+        (see setDownstreamFiles)."""
+        self._syncFiles.append(pattern)
+
+    def setOutputCapture(self,mode="file",maxBytes=1048576,compress=False):
+        """
+        Set how the stdout and stderr of the process are captured.
+
+        Parameters
+        ----------
+        mode     : "file" (default) writes the entire output to stdout.txt and stderr.txt,
+                   "ring" keeps only the last bytes of the output in memory and writes them
+                   to those files when the process finishes.
+        maxBytes : Size of the in-memory buffer of each stream in "ring" mode.
+        compress : In "ring" mode, if True the entire output is also streamed to compressed
+                   files (stdout.txt.gz and stderr.txt.gz), which are only kept if the run fails.
+                   Otherwise only the last "maxBytes" are kept, also when the run fails.
+        """
+        if mode not in ("file","ring"):
+            raise ValueError("Mode must be \"file\" or \"ring\".")
+        self._capture = mode
+        self._captureBytes = maxBytes
+        self._captureCompress = compress
+
+    def setExecutor(self,executor):
+        """
+        Set the executor that launches the process (e.g. SpawnExecutor or PreforkExecutor),
+        by default (None) the shared LocalExecutor.
+        """
+        self._executor = executor
+
+    def _getExecutor(self):
+        if self._executor is None: return getDefaultExecutor()
+        return self._executor
 
     def setMaxTries(self,num):
         """Sets the maximum number of times a run is re-tried should it fail."""
@@ -107,6 +385,14 @@ class ExternalRun:
     def getParameters(self):
         return self._parameters
 
+    def getStagedBytes(self):
+        """Return the number of bytes copied to stage the files of the last initialization."""
+        return self._stagedBytes
+
+    def getOutputBytes(self):
+        """Return the number of bytes of captured output (stdout/stderr) of the last run."""
+        return self._outputBytes
+
     def updateVariables(self,variables):
         """
         Update the set of variables associated with the run. This method is intended
@@ -115,28 +401,38 @@ class ExternalRun:
         """
         self._variables.update(variables)
 
-    def initialize(self):
+    def setDownstreamFiles(self,files):
+        """
+        Set the files consumed by functions and other runs (paths relative to the base
+        directory), those within the subdirectory of the run are copied back from the
+        scratch directory. This method is intended to be used by driver classes.
+        """
+        self._downstreamFiles = []
+        workDir = os.path.normpath(self._workDir)
+        for file in files:
+            if not file or os.path.isabs(file): continue
+            file = os.path.relpath(os.path.normpath(file),workDir)
+            if not file.startswith(os.pardir): self._downstreamFiles.append(file)
+        #end
+    #end
+
+    def getRelativeData(self):
+        """Return the data files that are relative to the base directory, e.g. outputs of other runs."""
+        return [file for file in self._dataFiles if not os.path.isabs(file)]
+
+    def initialize(self,baseDir=None):
         """
         Initialize the run, create the subdirectory, copy/symlink the data and
-        configuration files, and write the parameters and variables to the latter.
+        configuration files, and write the parameters and variables to the latter
+        (variables that are not written to files, e.g. SharedArrayWriter, are written once).
         Creates the process object, starting it in detached mode.
+        The subdirectory is created in "baseDir" (by default the current directory),
+        relative data files are also relative to it.
         """
         if self._isIni: return
 
         try:
-            os.mkdir(self._workDir)
-            for file, destination in zip(self._dataFiles, self._dataFilesDestination):
-                target = os.path.join(self._workDir,destination)
-                (shutil.copy,os.symlink)[self._symLinks](os.path.abspath(file),target)
-
-            for file in self._confFiles:
-                target = os.path.join(self._workDir,os.path.basename(file))
-                shutil.copy(file,target)
-                for par in self._parameters:
-                    par.writeToFile(target)
-                for var in self._variables:
-                    var.writeToFile(target)
-
+            self._stage(baseDir)
             self._createProcess()
             self._isIni = True
             self._isRun = False
@@ -148,12 +444,178 @@ class ExternalRun:
         #end
     #end
 
+    # the part of the initialization that prepares the run subdirectory
+    def _stage(self,baseDir):
+        self._stagedBytes = 0
+        self._syncJob = None
+        if baseDir is None: baseDir = os.curdir
+        self._baseDir = os.path.abspath(baseDir)
+        workDir = self._getWorkDir()
+
+        if self._scratch is None:
+            self._runDir = workDir
+            recycled = self._recycle and os.path.isdir(self._runDir)
+            if not recycled: os.mkdir(self._runDir)
+        else:
+            if not os.path.isdir(workDir): os.mkdir(workDir)
+            recycled = self._recycle and self._runDir != workDir and \
+                       os.path.isdir(self._runDir)
+            if not recycled:
+                prefix = os.path.basename(os.path.normpath(self._workDir))+"_"
+                self._runDir = tempfile.mkdtemp(prefix=prefix,dir=self._scratch)
+        #end
+
+        if recycled:
+            self._clearOutputs()
+            # only copies of relative data (e.g. results of other runs) are outdated
+            self._stageData(not self._isStaged)
+        else:
+            self._stageData(True)
+        #end
+        self._isStaged = self._recycle
+
+        for file in self._confFiles:
+            target = os.path.join(self._runDir,os.path.basename(file))
+            self._stagedBytes += _copy(file,target)
+            for par in self._parameters:
+                par.writeToFile(target)
+            for var in self._variables:
+                if getattr(var,"usesFiles",lambda: True)(): var.writeToFile(target)
+        #end
+        for var in self._variables:
+            if not getattr(var,"usesFiles",lambda: True)(): var.writeToFile(None)
+    #end
+
+    # absolute path of the working subdirectory
+    def _getWorkDir(self):
+        return os.path.join(self._baseDir,self._workDir)
+
+    def _stageData(self,all):
+        for file, destination, staging in zip(self._dataFiles, self._dataFilesDestination,
+                                              self._dataFilesStaging):
+            # symbolic links to relative data do not need to be staged again
+            if not all and (os.path.isabs(file) or staging == "symlink"): continue
+            target = os.path.join(self._runDir,destination)
+            if os.path.lexists(target): os.remove(target)
+            self._stagedBytes += self._STAGING_MODES[staging](os.path.join(self._baseDir,file),target)
+        #end
+    #end
+
+    def _clearOutputs(self):
+        for dir in {self._getWorkDir(),self._runDir}:
+            kept = set(self._dataFilesDestination)
+            for pattern in self._keptOutputs:
+                kept.update(os.path.relpath(file,dir) for file in glob.glob(os.path.join(dir,pattern)))
+
+            for root, dirs, files in os.walk(dir,topdown=False):
+                for name in files+[d for d in dirs if os.path.islink(os.path.join(root,d))]:
+                    path = os.path.join(root,name)
+                    if os.path.relpath(path,dir) not in kept: os.remove(path)
+                #end
+                if root != dir and not os.listdir(root): os.rmdir(root)
+            #end
+            for pattern in self._expectedNames:
+                for file in glob.glob(os.path.join(dir,pattern)):
+                    os.remove(file)
+        #end
+    #end
+
     def _createProcess(self):
-        self._stdout = open(os.path.join(self._workDir,"stdout.txt"),"w")
-        self._stderr = open(os.path.join(self._workDir,"stderr.txt"),"w")
+        executor = self._getExecutor()
+        if self._capture == "ring":
+            self._process = executor.launch(self._command,self._runDir,sp.PIPE,sp.PIPE)
+            self._rings = []
+            for pipe, name in zip((self._process.stdout,self._process.stderr),
+                                  ("stdout.txt","stderr.txt")):
+                gzFile = None
+                if self._captureCompress: gzFile = os.path.join(self._runDir,name+".gz")
+                self._rings.append(_RingCapture(pipe,self._captureBytes,gzFile))
+            #end
+            return
+        #end
+
+        self._stdout = open(os.path.join(self._runDir,"stdout.txt"),"w")
+        self._stderr = open(os.path.join(self._runDir,"stderr.txt"),"w")
 
-        self._process = sp.Popen(self._command,cwd=self._workDir,
-                        shell=True,stdout=self._stdout,stderr=self._stderr)
+        self._process = executor.launch(self._command,self._runDir,self._stdout,self._stderr)
+    #end
+
+    # asyncio version of _createProcess, ring captures are fed by tasks instead of threads
+    async def _acreateProcess(self):
+        self._ringTasks = None
+        t0 = time.perf_counter()
+        if self._capture == "ring":
+            self._process = await asyncio.create_subprocess_shell(self._command,
+                            cwd=self._runDir,stdout=asyncio.subprocess.PIPE,
+                            stderr=asyncio.subprocess.PIPE)
+            self._rings = []
+            self._ringTasks = []
+            for stream, name in zip((self._process.stdout,self._process.stderr),
+                                    ("stdout.txt","stderr.txt")):
+                gzFile = None
+                if self._captureCompress: gzFile = os.path.join(self._runDir,name+".gz")
+                ring = _RingCapture(None,self._captureBytes,gzFile)
+                self._rings.append(ring)
+                self._ringTasks.append(asyncio.ensure_future(ring.afeed(stream)))
+            #end
+            self._getExecutor()._recordLaunch(time.perf_counter()-t0)
+            return
+        #end
+
+        self._stdout = open(os.path.join(self._runDir,"stdout.txt"),"w")
+        self._stderr = open(os.path.join(self._runDir,"stderr.txt"),"w")
+
+        self._process = await asyncio.create_subprocess_shell(self._command,
+                        cwd=self._runDir,stdout=self._stdout,stderr=self._stderr)
+        self._getExecutor()._recordLaunch(time.perf_counter()-t0)
+    #end
+
+    # Write the captured output of a finished process, everything is kept on failure.
+    def _persistOutput(self):
+        if self._rings is None:
+            self._stdout.close()
+            self._stderr.close()
+            self._outputBytes = 0
+            for name in ("stdout.txt","stderr.txt"):
+                self._outputBytes += os.path.getsize(os.path.join(self._runDir,name))
+            return
+        #end
+        failed = self._process.returncode != 0 or not self._success(self._runDir)
+        self._outputBytes = 0
+        for ring, name in zip(self._rings,("stdout.txt","stderr.txt")):
+            self._outputBytes += ring.persist(os.path.join(self._runDir,name),failed)
+        self._rings = None
+    #end
+
+    # pool shared by all runs to copy files back from scratch directories
+    _syncPool = None
+    _syncLock = threading.Lock()
+
+    # Start copying files back from the scratch directory, return True when finished.
+    def _syncFromScratch(self,wait):
+        if self._runDir == self._getWorkDir(): return True
+
+        if self._syncJob is None:
+            with ExternalRun._syncLock:
+                if ExternalRun._syncPool is None:
+                    ExternalRun._syncPool = ThreadPoolExecutor(4)
+            #end
+            patterns = self._expectedNames+self._downstreamFiles+self._syncFiles+\
+                       ["stdout.txt","stderr.txt"]
+            self._syncJob = ExternalRun._syncPool.submit(_syncBack,self._runDir,
+                                                         self._getWorkDir(),patterns)
+        #end
+        if not wait and not self._syncJob.done(): return False
+
+        job = self._syncJob
+        self._syncJob = None
+        job.result()
+        return True
+    #end
+
+    def _removeScratch(self):
+        if self._runDir == self._getWorkDir() or self._recycle: return
+        shutil.rmtree(self._runDir,ignore_errors=True)
     #end
 
     def run(self,timeout=None):
@@ -164,6 +626,68 @@ class ExternalRun:
         """Polls the state of the process, does not wait for it to finish."""
         return self._exec(False,None)
 
+    async def arun(self,baseDir=None):
+        """
+        Coroutine that initializes (see initialize) and runs the process, retrying
+        as configured, without blocking the event loop. Returns the exit code.
+        A run already started with initialize(), or whose executor is not a local one,
+        is waited for in the default executor of the event loop.
+        """
+        if self._isRun: return self._retcode
+        if not self._isIni and not self._getExecutor().nativeAsync: self.initialize(baseDir)
+        if self._isIni:
+            return await asyncio.get_running_loop().run_in_executor(None,self.run)
+
+        try:
+            self._stage(baseDir)
+        except:
+            self._isError = True
+            raise
+        #end
+        self._isIni = True
+        self._isRun = False
+        self._isError = False
+        self._numTries = 0
+
+        while True:
+            if self._numTries == self._maxTries:
+                self._isError = True
+                raise RuntimeError("Run failed.")
+            #end
+            try:
+                await self._acreateProcess()
+                await self._process.wait()
+                if self._ringTasks: await asyncio.gather(*self._ringTasks)
+                self._ringTasks = None
+                self._persistOutput()
+                # the run only finishes after the files are copied back from scratch
+                if not self._syncFromScratch(False):
+                    await asyncio.wrap_future(self._syncJob)
+                    self._syncFromScratch(True)
+                #end
+            except:
+                self._isError = True
+                raise
+            #end
+
+            self._numTries += 1
+            self._retcode = self._process.returncode
+            self._isRun = True
+
+            if self._success():
+                self._removeScratch()
+                self._numTries = 0
+                return self._retcode
+            #end
+            if self._numTries < self._maxTries:
+                self.finalize()
+                self._isIni = True
+            else:
+                self._removeScratch()
+            #end
+        #end
+    #end
+
     # Common implementation of "run" and "poll"
     def _exec(self,wait,timeout):
         if not self._isIni:
@@ -182,6 +706,17 @@ class ExternalRun:
             status = self._process.poll() is not None
         #end
 
+        # the run only finishes after the files are copied back from scratch
+        if status:
+            try:
+                if self._syncJob is None: self._persistOutput()
+                status = self._syncFromScratch(wait)
+            except:
+                self._isError = True
+                raise
+            #end
+        #end
+
         if status:
             self._numTries += 1
             self._retcode = self._process.returncode
@@ -192,10 +727,13 @@ class ExternalRun:
                     self.finalize()
                     self._createProcess()
                     self._isIni = True
+                else:
+                    self._removeScratch()
                 #end
                 return self._exec(wait,timeout)
             #end
 
+            self._removeScratch()
             self._numTries = 0
         #end
 
@@ -214,6 +752,23 @@ class ExternalRun:
         """Return True if the run has failed."""
         return self._isError
 
+    def adoptRun(self,other,baseDir):
+        """
+        Take over the finished state of "other", a copy of this run that was evaluated
+        elsewhere and whose results were moved to "baseDir". This method is intended
+        to be used by driver classes.
+        """
+        self._baseDir = os.path.abspath(baseDir)
+        self._runDir = self._getWorkDir()
+        self._stagedBytes = other._stagedBytes
+        self._outputBytes = other._outputBytes
+        self._retcode = other._retcode
+        self._numTries = 0
+        self._isIni = True
+        self._isRun = True
+        self._isError = False
+    #end
+
     def finalize(self):
         """Reset "lazy" flags, close the stdout and stderr of the process."""
         try:
@@ -221,16 +776,76 @@ class ExternalRun:
             self._stderr.close()
         except:
             pass
+        self._rings = None
         self._isIni = False
         self._isRun = False
         self._isError = False
         self._retcode = -100
     #end
 
-    # check whether expected files were created
-    def _success(self):
-        for file in self._expectedFiles:
-            if not os.path.isfile(file): return False
+    # check whether expected files were created (by default in the working subdirectory)
+    def _success(self,dir=None):
+        if dir is None: dir = self._getWorkDir()
+        for file in self._expectedNames:
+            if not os.path.isfile(os.path.join(dir,file)): return False
         return True
     #end
 #end
+
+
+class ResidentRun(ExternalRun):
+    """
+    Evaluation step served by a long-lived solver process (see ResidentSolver) instead
+    of starting a new process for each design. The subdirectory is staged as for an
+    ExternalRun, then the request line is sent to the solver, the run finishes when the
+    solver reports it is done. It can be used wherever an ExternalRun can, e.g. the
+    direct and adjoint steps may share a solver using different requests.
+
+    Parameters
+    ----------
+    dir         : The subdirectory of the run.
+    solver      : A ResidentSolver, or the command to start one (with the default protocol).
+    request     : The request line, "{dir}" is replaced by the absolute path of the
+                  subdirectory (or of the scratch directory, see setScratchDirectory).
+    useSymLinks : See ExternalRun.
+    """
+    def __init__(self,dir,solver,request="RUN {dir}",useSymLinks=False):
+        ExternalRun.__init__(self,dir,request,useSymLinks)
+        if isinstance(solver,str): solver = ResidentSolver(solver)
+        self._executor = solver
+    #end
+
+    def getSolver(self):
+        return self._executor
+#end
+
+
+class PythonRun(ExternalRun):
+    """
+    Evaluation step that calls a Python function in a persistent pool of worker processes
+    (see PythonPool), e.g. for pre/post-processing, instead of a "python script.py"
+    command. The subdirectory is staged as for an ExternalRun (configuration and data
+    files, expected files, etc.), the function runs with it as the current directory,
+    and its output is captured like that of a process. The return value of the function
+    (None is 0) is the exit code, exceptions are 1.
+
+    Parameters
+    ----------
+    dir         : The subdirectory of the run.
+    function    : The callable, it must be picklable (e.g. a module-level function).
+    args        : Positional arguments of the function.
+    kwargs      : Keyword arguments of the function.
+    pool        : A PythonPool, by default one shared by all the runs.
+    useSymLinks : See ExternalRun.
+    """
+    _defaultPool = None
+
+    def __init__(self,dir,function,args=(),kwargs={},pool=None,useSymLinks=False):
+        ExternalRun.__init__(self,dir,(function,tuple(args),dict(kwargs)),useSymLinks)
+        if pool is None:
+            if PythonRun._defaultPool is None: PythonRun._defaultPool = PythonPool()
+            pool = PythonRun._defaultPool
+        #end
+        self._executor = pool
+    #end
+#end
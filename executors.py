@@ -0,0 +1,1162 @@
+#  Copyright 2019-2025, FADO Contributors (cf. AUTHORS.md)
+#
+#  This file is part of FADO.
+#
+#  FADO is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Lesser General Public License as published
+#  by the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  FADO is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public License
+#  along with FADO.  If not, see <https://www.gnu.org/licenses/>.
+
+import io
+import os
+import sys
+import hmac
+import json
+import time
+import shlex
+import shutil
+import socket
+import tarfile
+import weakref
+import argparse
+import tempfile
+import threading
+import traceback
+import socketserver
+import multiprocessing
+import subprocess as sp
+import concurrent.futures
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+
+class ExecutorBase:
+    """
+    Interface of the objects that launch the processes of ExternalRun (see setExecutor).
+    Derived classes implement "_launch", the launch latency (time taken by launch) is
+    measured for all of them.
+    """
+    # executors that ExternalRun can drive with asyncio subprocesses
+    nativeAsync = False
+
+    _instances = weakref.WeakSet()
+
+    def __init__(self):
+        self._statsLock = threading.Lock()
+        self.resetStats()
+        ExecutorBase._instances.add(self)
+    #end
+
+    def launch(self,command,cwd,stdout,stderr):
+        """
+        Start "command" in the directory "cwd". The "stdout" and "stderr" arguments are
+        open files or subprocess.PIPE. Returns an object with the interface of
+        subprocess.Popen (poll, wait, returncode, and the stdout and stderr pipes).
+        """
+        t0 = time.perf_counter()
+        process = self._launch(command,cwd,stdout,stderr)
+        self._recordLaunch(time.perf_counter()-t0)
+        return process
+    #end
+
+    # also used for launches that bypass "launch" (asyncio subprocesses)
+    def _recordLaunch(self,dt):
+        with self._statsLock:
+            self._launches += 1
+            self._latency += dt
+            self._maxLatency = max(self._maxLatency,dt)
+        #end
+    #end
+
+    def flush(self):
+        """
+        Called by the drivers after each pass over the evaluations, executors that
+        group launches (e.g. to submit them to a batch system) send them here.
+        """
+        pass
+
+    @staticmethod
+    def flushAll():
+        """Flush all the executors."""
+        for executor in list(ExecutorBase._instances): executor.flush()
+
+    def getStats(self):
+        """Returns a dictionary with the number of "launches" and the "mean" and "max"
+        launch latency in seconds."""
+        with self._statsLock:
+            return {"launches" : self._launches, "max" : self._maxLatency,
+                    "mean" : self._latency/max(1,self._launches)}
+        #end
+    #end
+
+    def resetStats(self):
+        with self._statsLock:
+            self._launches = 0
+            self._latency = 0.0
+            self._maxLatency = 0.0
+        #end
+    #end
+
+    # executors are shared by the copies of the runs (e.g. for other designs)
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self,memo):
+        return self
+#end
+
+
+class LocalExecutor(ExecutorBase):
+    """Launches shell commands on the local machine via subprocess.Popen (the default)."""
+    nativeAsync = True
+
+    def _launch(self,command,cwd,stdout,stderr):
+        return sp.Popen(command,cwd=cwd,shell=True,stdout=stdout,stderr=stderr)
+#end
+
+
+class SpawnExecutor(ExecutorBase):
+    """
+    Launches commands without going through /bin/sh, the command is split into
+    arguments (shlex) and the program is started directly, subprocess uses vfork or
+    posix_spawn for this where the platform allows it. Commands that need the shell
+    (pipes, redirections, variables, globs, etc.) are still run by the shell.
+    Relative program paths are relative to the working subdirectory.
+    """
+    _SHELL_CHARS = set("|&;<>()$`*?[]{}~\n")
+
+    def __init__(self):
+        ExecutorBase.__init__(self)
+        self._argvs = {}
+
+    # argument list of a command, None if it needs the shell
+    def _parse(self,command):
+        if command not in self._argvs:
+            argv = None
+            if not self._SHELL_CHARS.intersection(command):
+                try:
+                    argv = shlex.split(command)
+                    if not argv or "=" in argv[0]: argv = None
+                except ValueError:
+                    pass
+            #end
+            self._argvs[command] = argv
+        #end
+        return self._argvs[command]
+    #end
+
+    def _launch(self,command,cwd,stdout,stderr):
+        argv = self._parse(command)
+        if argv is None:
+            return sp.Popen(command,cwd=cwd,shell=True,stdout=stdout,stderr=stderr)
+        return sp.Popen(argv,cwd=cwd,stdout=stdout,stderr=stderr)
+    #end
+#end
+
+
+class PreforkExecutor(ExecutorBase):
+    """
+    Launches shell commands from a small helper process that is started (forked) once,
+    so that launches do not fork the, possibly large, driver process. The output files
+    or pipes are passed to the helper over a Unix socket, the processes returned by
+    launch are proxies that are updated when the helper reports their exit code.
+    Use close() to stop the helper, it waits for the running processes first.
+    """
+    def __init__(self):
+        ExecutorBase.__init__(self)
+        self._sock, child = socket.socketpair(socket.AF_UNIX,socket.SOCK_SEQPACKET)
+        self._helper = sp.Popen([sys.executable,"-I",os.path.abspath(__file__),
+                                 "prefork",str(child.fileno())],
+                                pass_fds=(child.fileno(),))
+        child.close()
+        self._lock = threading.Lock()
+        self._processes = {}
+        self._nextId = 0
+        self._reader = threading.Thread(target=self._receive,daemon=True)
+        self._reader.start()
+    #end
+
+    def _launch(self,command,cwd,stdout,stderr):
+        # the helper gets the write ends of new pipes or the files
+        fds, readers = _outputFds(stdout,stderr)
+        with self._lock:
+            id = self._nextId
+            self._nextId += 1
+            process = _ProxyProcess(command,*readers)
+            self._processes[id] = process
+        #end
+        try:
+            message = json.dumps({"id" : id, "command" : command, "cwd" : cwd})
+            socket.send_fds(self._sock,[message.encode()],fds)
+        finally:
+            for fd, reader in zip(fds,readers):
+                if reader is not None: os.close(fd)
+        #end
+        process._started.wait()
+        if process._error is not None:
+            raise OSError("Launch failed: "+process._error)
+        return process
+    #end
+
+    # dispatch the messages of the helper to the proxies
+    def _receive(self):
+        while True:
+            try:
+                data = self._sock.recv(4096)
+            except OSError:
+                data = b""
+            if not data: break
+            message = json.loads(data.decode())
+            with self._lock:
+                process = self._processes.get(message["id"])
+                if "rc" in message: self._processes.pop(message["id"],None)
+            #end
+            if process is None: continue
+            process._update(message)
+        #end
+        # the helper is gone, nothing else will finish
+        with self._lock:
+            for process in self._processes.values():
+                process._update({"error" : "helper process exited", "rc" : -1})
+            self._processes = {}
+        #end
+    #end
+
+    def close(self):
+        """Stop the helper process."""
+        try:
+            self._sock.shutdown(socket.SHUT_WR)
+            self._helper.wait()
+            self._reader.join()
+        except OSError:
+            pass
+    #end
+#end
+
+
+# File descriptors where the output of a process must be written, for subprocess.PIPE
+# a new pipe is created and the read end is returned as a file (None for files).
+def _outputFds(stdout,stderr):
+    fds = []
+    readers = []
+    for stream in (stdout,stderr):
+        if stream == sp.PIPE:
+            r, w = os.pipe()
+            fds.append(w)
+            readers.append(os.fdopen(r,"rb"))
+        else:
+            fds.append(stream.fileno())
+            readers.append(None)
+        #end
+    #end
+    return fds, readers
+#end
+
+
+# Files where the output of a process that cannot write to pipes (e.g. a batch job) must
+# be written. For subprocess.PIPE the file is in "cwd", and a pipe is created, returns the
+# files, the (file, write end) pairs to use with _feedPipes, and the read ends (or None).
+def _outputFiles(cwd,stdout,stderr):
+    files = []
+    pipes = []
+    readers = []
+    for stream, name in zip((stdout,stderr),(".fado_stdout",".fado_stderr")):
+        if stream == sp.PIPE:
+            r, w = os.pipe()
+            files.append(os.path.join(cwd,name))
+            pipes.append((files[-1],w))
+            readers.append(os.fdopen(r,"rb"))
+        else:
+            files.append(os.path.abspath(stream.name))
+            readers.append(None)
+        #end
+    #end
+    return files, pipes, readers
+#end
+
+# write the contents of the files to the pipes, and remove them
+def _feedPipes(pipes):
+    for file, fd in pipes:
+        try:
+            with open(file,"rb") as f:
+                while True:
+                    data = f.read(65536)
+                    if not data: break
+                    os.write(fd,data)
+                #end
+            #end
+            os.remove(file)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+    #end
+#end
+
+
+# process started by another one (e.g. the helper of PreforkExecutor or a WorkerAgent)
+class _ProxyProcess:
+    def __init__(self,command,stdout,stderr):
+        self.args = command
+        self.pid = None
+        self.returncode = None
+        self.stdout = stdout
+        self.stderr = stderr
+        self._error = None
+        self._started = threading.Event()
+        self._done = threading.Event()
+    #end
+
+    def _update(self,message):
+        if "pid" in message: self.pid = message["pid"]
+        if "error" in message: self._error = message["error"]
+        if "rc" in message:
+            self.returncode = message["rc"]
+            self._done.set()
+        #end
+        self._started.set()
+    #end
+
+    def poll(self):
+        return self.returncode
+
+    def wait(self,timeout=None):
+        if not self._done.wait(timeout): raise sp.TimeoutExpired(self.args,timeout)
+        return self.returncode
+    #end
+#end
+
+
+# main loop of the helper process of PreforkExecutor
+def _preforkHelper(fd):
+    sock = socket.socket(fileno=fd)
+    lock = threading.Lock()
+
+    def send(message):
+        with lock: sock.send(json.dumps(message).encode())
+
+    def waitFor(id,process):
+        send({"id" : id, "rc" : process.wait()})
+
+    threads = []
+    while True:
+        data, fds, _, _ = socket.recv_fds(sock,65536,2)
+        if not data: break
+        message = json.loads(data.decode())
+        try:
+            process = sp.Popen(message["command"],cwd=message["cwd"],shell=True,
+                               stdout=fds[0],stderr=fds[1])
+            send({"id" : message["id"], "pid" : process.pid})
+            thread = threading.Thread(target=waitFor,args=(message["id"],process))
+            thread.start()
+            threads = [t for t in threads if t.is_alive()]+[thread]
+        except Exception as err:
+            send({"id" : message["id"], "error" : str(err), "rc" : -1})
+        finally:
+            for fd in fds: os.close(fd)
+        #end
+    #end
+    for thread in threads: thread.join()
+#end
+
+
+_defaultExecutor = None
+
+def getDefaultExecutor():
+    """Returns the LocalExecutor used by runs without an executor."""
+    global _defaultExecutor
+    if _defaultExecutor is None: _defaultExecutor = LocalExecutor()
+    return _defaultExecutor
+#end
+
+
+class BatchExecutor(ExecutorBase):
+    """
+    Submits the processes as jobs of a batch scheduler (SLURM by default). Launches are
+    queued and submitted by flush (called by the drivers after each pass over the
+    evaluations, or when a run is waited for), those submitted together form a job array.
+    The job script records the exit code of each command in a sentinel file in its
+    working subdirectory, the status command is used to detect jobs that ended without
+    writing it (e.g. cancelled or out of time), these are reported as failed (-1).
+
+    Parameters
+    ----------
+    directives    : List of lines added to the job scripts, e.g. ["#SBATCH -n 4"].
+    submitCommand : Command that submits a script (appended to it) and prints the job id.
+    statusCommand : Command that lists the active jobs among "{jobs}" (comma separated ids).
+    arrayOption   : Option of the submit command to create an array with tasks 0 to "{last}".
+    taskVariable  : Environment variable with the index of the task in the array.
+    pollInterval  : Minimum time (seconds) between calls to the status command.
+    scriptDir     : Where job scripts are written, by default the parent of the working
+                    subdirectory of the first task. Must be visible to the compute nodes.
+    """
+    _SENTINEL = ".fado_exit"
+
+    def __init__(self,directives=[],submitCommand="sbatch --parsable",
+                 statusCommand="squeue -h -o %i -j {jobs}",arrayOption="--array=0-{last}",
+                 taskVariable="SLURM_ARRAY_TASK_ID",pollInterval=10.0,scriptDir=None):
+        ExecutorBase.__init__(self)
+        self._directives = list(directives)
+        self._submitCommand = submitCommand
+        self._statusCommand = statusCommand
+        self._arrayOption = arrayOption
+        self._taskVariable = taskVariable
+        self._pollInterval = pollInterval
+        self._scriptDir = scriptDir
+        self._lock = threading.Lock()
+        self._queue = []
+        self._jobs = {}
+        self._numScripts = 0
+        self._lastStatus = 0.0
+    #end
+
+    # the latency of a batch launch is measured up to its submission (see flush)
+    def launch(self,command,cwd,stdout,stderr):
+        return self._launch(command,cwd,stdout,stderr)
+
+    def _launch(self,command,cwd,stdout,stderr):
+        job = _BatchJob(self,command,cwd,stdout,stderr)
+        with self._lock: self._queue.append(job)
+        return job
+    #end
+
+    def flush(self):
+        """Submit the queued launches, as a job array if there are several."""
+        with self._lock:
+            tasks = self._queue
+            self._queue = []
+        #end
+        if not tasks: return
+        scriptDir = self._scriptDir
+        if scriptDir is None: scriptDir = os.path.dirname(os.path.normpath(tasks[0].cwd))
+        with self._lock:
+            script = os.path.join(scriptDir,"fado_job_"+str(self._numScripts)+".sh")
+            self._numScripts += 1
+        #end
+        try:
+            jobId = self._submit(tasks,script)
+        except Exception:
+            for task in tasks: task._complete(-1)
+            return
+        #end
+        now = time.perf_counter()
+        with self._lock: self._jobs[jobId] = (tasks,script)
+        for task in tasks:
+            task.pid = jobId
+            self._recordLaunch(now-task._launchTime)
+        #end
+    #end
+
+    def _submit(self,tasks,script):
+        lines = ["#!/bin/bash"]+self._directives
+        if len(tasks) == 1:
+            lines.append(tasks[0]._script())
+        else:
+            lines.append("case \"$"+self._taskVariable+"\" in")
+            for i, task in enumerate(tasks):
+                lines += [str(i)+")",task._script(),";;"]
+            lines.append("esac")
+        #end
+        with open(script,"w") as f:
+            f.write("\n".join(lines)+"\n")
+
+        command = self._submitCommand
+        if len(tasks) > 1: command += " "+self._arrayOption.format(last=len(tasks)-1)
+        command += " "+shlex.quote(script)
+        result = sp.run(command,shell=True,capture_output=True,text=True,check=True)
+        # e.g. "1234" or "1234;cluster" (--parsable) or "Submitted batch job 1234"
+        return result.stdout.strip().split(";")[0].split()[-1]
+    #end
+
+    # detect jobs that ended without writing the sentinel files (at most every pollInterval)
+    def _checkStatus(self):
+        with self._lock:
+            if time.time()-self._lastStatus < self._pollInterval: return
+            self._lastStatus = time.time()
+            jobs = dict(self._jobs)
+        #end
+        if not jobs: return
+
+        result = sp.run(self._statusCommand.format(jobs=",".join(jobs)),shell=True,
+                        capture_output=True,text=True)
+        if result.returncode != 0:
+            # SLURM reports an error when none of the jobs are known anymore
+            if "invalid job id" not in result.stderr.lower(): return
+            result.stdout = ""
+        #end
+        # array tasks are listed as "id_index" or "id_[range]"
+        active = {line.split("_")[0] for line in result.stdout.split()}
+
+        for jobId, (tasks,_) in jobs.items():
+            for task in tasks:
+                if task.returncode is None: task._checkSentinel()
+                # the sentinel may take a while to become visible on a network file system
+                if task.returncode is None and jobId not in active:
+                    task._missed += 1
+                    if task._missed > 1: task._complete(-1)
+                #end
+            #end
+        #end
+    #end
+
+    # forget a job when all its tasks completed
+    def _taskDone(self,task):
+        with self._lock:
+            if task.pid not in self._jobs: return
+            tasks, script = self._jobs[task.pid]
+            if any(t.returncode is None for t in tasks): return
+            self._jobs.pop(task.pid)
+        #end
+        try: os.remove(script)
+        except OSError: pass
+    #end
+#end
+
+
+# process submitted by BatchExecutor (a task of a job array), "pid" is the job id
+class _BatchJob:
+    def __init__(self,executor,command,cwd,stdout,stderr):
+        self.args = command
+        self.pid = None
+        self.returncode = None
+        self.cwd = os.path.abspath(cwd)
+        self.stdout = None
+        self.stderr = None
+        self._executor = executor
+        self._launchTime = time.perf_counter()
+        self._missed = 0
+        self._sentinel = os.path.join(self.cwd,BatchExecutor._SENTINEL)
+        # the job writes the output to files, which are fed to the pipes at the end
+        self._outFiles, self._pipes, (self.stdout,self.stderr) = \
+            _outputFiles(self.cwd,stdout,stderr)
+        try: os.remove(self._sentinel)
+        except FileNotFoundError: pass
+    #end
+
+    def _script(self):
+        q = shlex.quote
+        out, err = self._outFiles
+        return "cd "+q(self.cwd)+" && ( "+self.args+" ) > "+q(out)+" 2> "+q(err)+"\n"+\
+               "echo $? > "+q(self._sentinel+".tmp")+" && mv "+q(self._sentinel+".tmp")+\
+               " "+q(self._sentinel)
+    #end
+
+    def _checkSentinel(self):
+        try:
+            with open(self._sentinel) as f: rc = int(f.read())
+        except (OSError,ValueError):
+            return
+        self._complete(rc)
+    #end
+
+    def _complete(self,rc):
+        if self.returncode is not None: return
+        if self._pipes:
+            threading.Thread(target=_feedPipes,args=(self._pipes,),daemon=True).start()
+        self.returncode = rc
+        self._executor._taskDone(self)
+    #end
+
+    def poll(self):
+        if self.returncode is None: self._checkSentinel()
+        if self.returncode is None: self._executor._checkStatus()
+        return self.returncode
+    #end
+
+    def wait(self,timeout=None):
+        if self.pid is None: self._executor.flush()
+        start = time.time()
+        while self.poll() is None:
+            if timeout is not None and time.time()-start > timeout:
+                raise sp.TimeoutExpired(self.args,timeout)
+            time.sleep(min(1.0,self._executor._pollInterval))
+        #end
+        return self.returncode
+    #end
+#end
+
+
+class ResidentSolver(ExecutorBase):
+    """
+    A long-lived solver process that serves the runs (see ResidentRun) one at a time,
+    which avoids paying its start-up cost (launch, MPI initialization, mesh reading,
+    partitioning, etc.) for every design. It is started by the first run and restarted
+    by the next one if it exits. The protocol is line-based:
+      - Once initialized, the solver prints a line starting with "ready".
+      - For each run it receives a request line, e.g. "RUN /path/to/subdirectory" (see
+        ResidentRun), it evaluates the design whose files are in that directory, and
+        prints a line with "done" and the exit code (e.g. "DONE 0").
+      - Other output is written to the stdout or stderr of the current run.
+      - It should exit when it receives "exit" or its input is closed (see close).
+
+    Parameters
+    ----------
+    command : Shell command that starts the solver.
+    cwd     : Directory where it starts, by default that of the first run.
+    ready   : Readiness line.
+    done    : Prefix of the completion line.
+    exit    : Line sent by close.
+    """
+    def __init__(self,command,cwd=None,ready="READY",done="DONE",exit="EXIT"):
+        ExecutorBase.__init__(self)
+        self._command = command
+        self._cwd = cwd
+        self._ready = ready
+        self._done = done
+        self._exit = exit
+        self._lock = threading.Lock()
+        self._process = None
+        self._queue = []
+        self._current = None
+        self._isReady = False
+        self._startup = []
+    #end
+
+    def _launch(self,command,cwd,stdout,stderr):
+        fds, readers = _outputFds(stdout,stderr)
+        request = _ProxyProcess(command.format(dir=os.path.abspath(cwd)),*readers)
+        request._fds = [(fd,reader is not None) for fd,reader in zip(fds,readers)]
+        with self._lock:
+            if self._cwd is None: self._cwd = os.path.dirname(os.path.abspath(cwd))
+            self._queue.append(request)
+            if self._process is None: self._start()
+            self._next()
+        #end
+        return request
+    #end
+
+    # start the solver, requests are only sent after it is ready (lock held)
+    def _start(self):
+        self._process = sp.Popen(self._command,cwd=self._cwd,shell=True,stdin=sp.PIPE,
+                                 stdout=sp.PIPE,stderr=sp.PIPE)
+        self._isReady = False
+        self._startup = []
+        for pipe, stream in ((self._process.stdout,0),(self._process.stderr,1)):
+            threading.Thread(target=self._read,args=(self._process,pipe,stream),
+                             daemon=True).start()
+        #end
+    #end
+
+    # send the next request if the solver is idle (lock held)
+    def _next(self):
+        if self._current is not None or not self._queue or not self._isReady: return
+        self._current = self._queue.pop(0)
+        try:
+            self._process.stdin.write((self._current.args+"\n").encode())
+            self._process.stdin.flush()
+        except OSError:
+            pass # the readers will notice that the solver exited
+        self._current._update({"pid" : self._process.pid})
+    #end
+
+    def _finish(self,rc):
+        request = self._current
+        self._current = None
+        for fd, owned in request._fds:
+            if owned: os.close(fd)
+        request._update({"rc" : rc})
+    #end
+
+    # read the output of the solver, dispatch it to the current request
+    def _read(self,process,pipe,stream):
+        for line in iter(pipe.readline,b""):
+            with self._lock:
+                text = line.decode(errors="replace").strip()
+                if stream == 0 and not self._isReady:
+                    self._isReady = text.startswith(self._ready)
+                    if not self._isReady: self._startup.append(line)
+                    self._next()
+                elif stream == 0 and text.startswith(self._done):
+                    try: rc = int(text[len(self._done):])
+                    except ValueError: rc = -1
+                    if self._current is not None: self._finish(rc)
+                    self._next()
+                elif self._current is not None:
+                    os.write(self._current._fds[stream][0],line)
+                #end
+            #end
+        #end
+        if stream == 1: return
+
+        # the solver exited, the current request failed and the others need a new
+        # solver, unless this one failed to start (then they all fail)
+        process.wait()
+        with self._lock:
+            if self._process is not process: return
+            self._process = None
+            if not self._isReady:
+                self._queue, failed = [], self._queue
+            else:
+                failed = []
+                if self._current is not None: failed.append(self._current)
+            #end
+            for request in failed:
+                self._current = request
+                for line in self._startup: os.write(request._fds[0][0],line)
+                self._finish(-1)
+            #end
+            if self._queue: self._start()
+        #end
+    #end
+
+    def getStartupOutput(self):
+        """Output of the solver before it became ready the last time it was started."""
+        return b"".join(self._startup).decode(errors="replace")
+
+    def close(self):
+        """Ask the solver to exit and wait for it."""
+        with self._lock:
+            process = self._process
+            self._process = None
+        #end
+        if process is None: return
+        try:
+            process.stdin.write((self._exit+"\n").encode())
+            process.stdin.close()
+        except OSError:
+            pass
+        process.wait()
+    #end
+#end
+
+
+class PythonPool(ExecutorBase):
+    """
+    Runs Python callables (see PythonRun) in a persistent pool of worker processes, which
+    avoids paying the start-up of the interpreter and the imports for every design.
+    The callables and their arguments must be picklable (e.g. module-level functions).
+
+    Parameters
+    ----------
+    maxWorkers  : Number of worker processes, by default the number of CPUs.
+    context     : multiprocessing context (or start method name) of the workers.
+    initializer : Callable run by each worker when it starts, e.g. to import modules.
+    """
+    def __init__(self,maxWorkers=None,context=None,initializer=None):
+        ExecutorBase.__init__(self)
+        if isinstance(context,str): context = multiprocessing.get_context(context)
+        self._poolArgs = (maxWorkers,context,initializer)
+        self._pool = ProcessPoolExecutor(*self._poolArgs)
+    #end
+
+    def _launch(self,command,cwd,stdout,stderr):
+        function, args, kwargs = command
+        cwd = os.path.abspath(cwd)
+        files, pipes, readers = _outputFiles(cwd,stdout,stderr)
+        try:
+            future = self._pool.submit(_callInDir,function,args,kwargs,cwd,files)
+        except BrokenProcessPool:
+            # a worker died (failing the calls in progress), start a new pool
+            self._pool = ProcessPoolExecutor(*self._poolArgs)
+            future = self._pool.submit(_callInDir,function,args,kwargs,cwd,files)
+        #end
+        return _FutureProcess(future,function,pipes,*readers)
+    #end
+
+    def close(self):
+        """Shut down the workers, waiting for the running calls."""
+        self._pool.shutdown()
+#end
+
+
+# Run by a worker of PythonPool: the callable runs in "dir" with its output (including
+# that of compiled extensions) redirected to the files, the return code is that of the
+# callable (0 if None) or 1 if it raises.
+def _callInDir(function,args,kwargs,dir,files):
+    cwd = os.getcwd()
+    saved = []
+    for stream, fd, file in zip((sys.stdout,sys.stderr),(1,2),files):
+        stream.flush()
+        saved.append(os.dup(fd))
+        with open(file,"ab") as f: os.dup2(f.fileno(),fd)
+    #end
+    try:
+        os.chdir(dir)
+        rc = function(*args,**kwargs)
+        if rc is None: rc = 0
+    except BaseException:
+        traceback.print_exc()
+        rc = 1
+    finally:
+        os.chdir(cwd)
+        for stream, fd, old in zip((sys.stdout,sys.stderr),(1,2),saved):
+            stream.flush()
+            os.dup2(old,fd)
+            os.close(old)
+        #end
+    #end
+    return int(rc)
+#end
+
+
+# call submitted to PythonPool
+class _FutureProcess:
+    def __init__(self,future,function,pipes,stdout,stderr):
+        self.args = function
+        self.pid = None
+        self.stdout = stdout
+        self.stderr = stderr
+        self._future = future
+        self._pipes = pipes
+        self._lock = threading.Lock()
+        self.returncode = None
+    #end
+
+    def _complete(self):
+        with self._lock:
+            if self.returncode is not None: return
+            try:
+                rc = self._future.result()
+            except Exception:
+                rc = -1 # the worker died
+            if self._pipes:
+                threading.Thread(target=_feedPipes,args=(self._pipes,),daemon=True).start()
+            self.returncode = rc
+        #end
+    #end
+
+    def poll(self):
+        if self._future.done(): self._complete()
+        return self.returncode
+    #end
+
+    def wait(self,timeout=None):
+        done, _ = concurrent.futures.wait([self._future],timeout)
+        if not done: raise sp.TimeoutExpired(self.args,timeout)
+        self._complete()
+        return self.returncode
+    #end
+#end
+
+
+class RemoteExecutor(ExecutorBase):
+    """
+    Launches shell commands on worker agents (see WorkerAgent) over TCP, each launch
+    goes to the agent with the most free slots. The output of the process is streamed
+    back as it is produced, and the exit code when it finishes.
+
+    Parameters
+    ----------
+    agents  : List of (host,port) addresses of the agents.
+    stage   : If False (default) the working subdirectories must be on a file system that
+              is shared with the agents (paths can be translated with "pathMap").
+              If True, the contents of the subdirectory are sent to the agent, which runs
+              the command in a temporary directory and sends back the files it modified.
+    pathMap : Dictionary of local path prefixes and their remote equivalent.
+    token   : Shared secret expected by the agents (required).
+    """
+    def __init__(self,agents,stage=False,pathMap={},token=None):
+        if not token: raise ValueError("A token is required to connect to the agents.")
+        ExecutorBase.__init__(self)
+        self._stage = stage
+        self._pathMap = dict(pathMap)
+        self._lock = threading.Lock()
+        self._processes = {}
+        self._nextId = 0
+        self._agents = []
+        for address in agents:
+            agent = _AgentConnection(socket.create_connection(tuple(address)))
+            agent.send({"op" : "hello", "token" : token})
+            header, _ = agent.receive()
+            if header is None or header.get("event") != "hello":
+                raise ConnectionError("Agent "+str(address)+" refused the connection.")
+            agent.slots = header["slots"]
+            agent.thread = threading.Thread(target=self._receive,args=(agent,),daemon=True)
+            agent.thread.start()
+            self._agents.append(agent)
+        #end
+    #end
+
+    def getNumSlots(self):
+        """Total number of slots of the agents."""
+        return sum(agent.slots for agent in self._agents)
+
+    def _remotePath(self,path):
+        for local, remote in self._pathMap.items():
+            if path.startswith(local): return remote+path[len(local):]
+        return path
+    #end
+
+    def _launch(self,command,cwd,stdout,stderr):
+        # the output is written to the files or to new pipes
+        fds, readers = _outputFds(stdout,stderr)
+        payload = b""
+        if self._stage: payload = _packDir(cwd)
+
+        with self._lock:
+            agent = min(self._agents,key=lambda agent: agent.running/agent.slots)
+            agent.running += 1
+            id = self._nextId
+            self._nextId += 1
+            process = _ProxyProcess(command,*readers)
+            process._fds = [(fd,reader is not None) for fd,reader in zip(fds,readers)]
+            process._cwd = cwd
+            process._agent = agent
+            self._processes[id] = process
+        #end
+        agent.send({"op" : "launch", "id" : id, "command" : command,
+                    "cwd" : self._remotePath(cwd)},payload)
+
+        # wait for the agent to accept it
+        process._started.wait()
+        if process._error is not None:
+            raise OSError("Launch failed: "+process._error)
+        return process
+    #end
+
+    # dispatch the messages of an agent to the proxies
+    def _receive(self,agent):
+        while True:
+            try:
+                header, payload = agent.receive()
+            except (OSError,ValueError):
+                header = None
+            if header is None: break
+            with self._lock:
+                process = self._processes.get(header["id"])
+                if "rc" in header: self._processes.pop(header["id"],None)
+            #end
+            if process is None: continue
+
+            if header["event"] == "output":
+                os.write(process._fds[header["stream"]][0],payload)
+                continue
+            #end
+            if "rc" in header:
+                try:
+                    if payload: _unpackDir(payload,process._cwd)
+                except Exception as err:
+                    header = {"error" : "could not retrieve files, "+str(err), "rc" : -1}
+                #end
+                self._finish(process,header)
+            else:
+                process._update(header)
+            #end
+        #end
+        # the connection is lost, nothing else will finish
+        with self._lock:
+            lost = [id for id,p in self._processes.items() if p._agent is agent]
+            lost = [self._processes.pop(id) for id in lost]
+        #end
+        for process in lost:
+            self._finish(process,{"error" : "connection to agent lost", "rc" : -1})
+    #end
+
+    def _finish(self,process,message):
+        with self._lock: process._agent.running -= 1
+        for fd, owned in process._fds:
+            if owned: os.close(fd)
+        process._update(message)
+    #end
+
+    def close(self):
+        """Close the connections to the agents."""
+        for agent in self._agents:
+            try: agent.sock.shutdown(socket.SHUT_RDWR)
+            except OSError: pass
+            agent.thread.join()
+            agent.sock.close()
+        #end
+    #end
+#end
+
+
+# Messages between RemoteExecutor and WorkerAgent are one line of JSON followed by
+# a payload of "size" bytes (output, or a tar.gz of a directory).
+class _AgentConnection:
+    def __init__(self,sock):
+        self.sock = sock
+        self.file = sock.makefile("rb")
+        self.lock = threading.Lock()
+        self.slots = 1
+        self.running = 0
+        self.thread = None
+    #end
+
+    def send(self,header,payload=b""):
+        header = dict(header,size=len(payload))
+        with self.lock:
+            self.sock.sendall(json.dumps(header).encode()+b"\n"+payload)
+    #end
+
+    def receive(self):
+        line = self.file.readline()
+        if not line: return None, None
+        header = json.loads(line.decode())
+        payload = b""
+        if header["size"] > 0: payload = self.file.read(header["size"])
+        return header, payload
+    #end
+#end
+
+
+# tar.gz of the files of a directory (following symbolic links), optionally only of
+# those modified after "since"
+def _packDir(dir,since=None):
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer,mode="w:gz",dereference=True,compresslevel=1) as tar:
+        for root, _, files in os.walk(dir):
+            for file in files:
+                path = os.path.join(root,file)
+                if since is not None and os.path.getmtime(path) < since: continue
+                tar.add(path,os.path.relpath(path,dir))
+            #end
+        #end
+    #end
+    return buffer.getvalue()
+#end
+
+def _unpackDir(data,dir):
+    with tarfile.open(fileobj=io.BytesIO(data),mode="r:gz") as tar:
+        if hasattr(tarfile,"data_filter"): tar.extractall(dir,filter="data")
+        else: tar.extractall(dir)
+    #end
+#end
+
+
+class WorkerAgent:
+    """
+    Runs the processes launched by RemoteExecutor on this host, at most "slots" at a time
+    (others wait in a queue). It only depends on the standard library, a host can run it
+    with "python executors.py agent --host HOST --port PORT --slots N --token TOKEN".
+    Clients can run arbitrary commands, therefore a token is required. There is no
+    encryption, bind it to trusted networks only.
+
+    Parameters
+    ----------
+    host      : Interface to listen on (by default only this machine).
+    port      : TCP port, 0 selects a free one (see getAddress).
+    slots     : Maximum number of simultaneous processes, by default the number of CPUs.
+    token     : Shared secret that clients must present (required).
+    workspace : Where temporary run directories are created (when the client stages them).
+    """
+    def __init__(self,host="127.0.0.1",port=0,slots=None,token=None,workspace=None):
+        if not token: raise ValueError("WorkerAgent requires a non-empty token.")
+        if slots is None: slots = os.cpu_count() or 1
+        self._server = socketserver.ThreadingTCPServer((host,port),_AgentHandler)
+        self._server.daemon_threads = True
+        self._server.slots = slots
+        self._server.semaphore = threading.Semaphore(slots)
+        self._server.token = token
+        self._server.workspace = workspace
+        self._thread = None
+    #end
+
+    def getAddress(self):
+        return self._server.server_address
+
+    def serve(self):
+        """Serve requests until stop() is called."""
+        self._server.serve_forever()
+
+    def start(self):
+        """Serve requests in a background thread."""
+        self._thread = threading.Thread(target=self.serve,daemon=True)
+        self._thread.start()
+    #end
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None: self._thread.join()
+    #end
+#end
+
+
+class _AgentHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        connection = _AgentConnection(self.connection)
+        header, _ = connection.receive()
+        token = None if header is None else header.get("token")
+        if not isinstance(token,str) or \
+           not hmac.compare_digest(token.encode(),self.server.token.encode()):
+            connection.send({"event" : "denied"})
+            return
+        #end
+        connection.send({"event" : "hello", "slots" : self.server.slots})
+
+        while True:
+            try:
+                header, payload = connection.receive()
+            except (OSError,ValueError):
+                break
+            if header is None: break
+            if header["op"] != "launch": continue
+            connection.send({"id" : header["id"], "event" : "accepted"})
+            threading.Thread(target=self._run,args=(connection,header,payload),
+                             daemon=True).start()
+        #end
+    #end
+
+    def _run(self,connection,header,payload):
+        id = header["id"]
+        runDir = header["cwd"]
+        tmpDir = None
+        try:
+            with self.server.semaphore:
+                if payload:
+                    tmpDir = tempfile.mkdtemp(prefix="fado_",dir=self.server.workspace)
+                    _unpackDir(payload,tmpDir)
+                    runDir = tmpDir
+                #end
+                start = time.time()
+                process = sp.Popen(header["command"],cwd=runDir,shell=True,
+                                   stdout=sp.PIPE,stderr=sp.PIPE)
+                connection.send({"id" : id, "event" : "started", "pid" : process.pid})
+
+                def pump(pipe,stream):
+                    while True:
+                        data = pipe.read1(65536)
+                        if not data: break
+                        connection.send({"id" : id, "event" : "output", "stream" : stream},data)
+                    #end
+                #end
+                pumps = [threading.Thread(target=pump,args=(pipe,i))
+                         for i,pipe in enumerate((process.stdout,process.stderr))]
+                for thread in pumps: thread.start()
+                rc = process.wait()
+                for thread in pumps: thread.join()
+
+                result = b""
+                if tmpDir is not None: result = _packDir(tmpDir,start)
+            #end
+            connection.send({"id" : id, "event" : "exit", "rc" : rc},result)
+        except Exception as err:
+            try: connection.send({"id" : id, "event" : "error", "error" : str(err), "rc" : -1})
+            except OSError: pass
+        finally:
+            if tmpDir is not None: shutil.rmtree(tmpDir,ignore_errors=True)
+        #end
+    #end
+#end
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Helper processes of FADO executors.")
+    commands = parser.add_subparsers(dest="command",required=True)
+    prefork = commands.add_parser("prefork")
+    prefork.add_argument("fd",type=int)
+    agent = commands.add_parser("agent")
+    agent.add_argument("--host",default="127.0.0.1")
+    agent.add_argument("--port",type=int,default=0)
+    agent.add_argument("--slots",type=int,default=None)
+    agent.add_argument("--token",required=True)
+    agent.add_argument("--workspace",default=None)
+    args = parser.parse_args()
+
+    if args.command == "prefork":
+        _preforkHelper(args.fd)
+    else:
+        server = WorkerAgent(args.host,args.port,args.slots,args.token,args.workspace)
+        print("Listening on "+":".join(map(str,server.getAddress())),flush=True)
+        server.serve()
+    #end
+#end
@@ -15,8 +15,26 @@
 #  You should have received a copy of the GNU Lesser General Public License
 #  along with FADO.  If not, see <https://www.gnu.org/licenses/>.
 
+import os
 import numpy as np
 import abc
+import inspect
+
+
+# resolve a file relative to the base directory, if one is given
+def _resolve(file,baseDir):
+    if baseDir is None: return file
+    return os.path.join(baseDir,file)
+
+
+# initialize an evaluation step relative to the base directory, custom steps whose
+# initialize() takes no arguments use the current directory
+def _initializeStep(evl,baseDir=None):
+    if baseDir is None or not inspect.signature(evl.initialize).parameters:
+        evl.initialize()
+    else:
+        evl.initialize(baseDir)
+    #end
 
 
 class FunctionBase(abc.ABC):
@@ -36,11 +54,11 @@ class FunctionBase(abc.ABC):
         return self._variables
 
     @abc.abstractmethod
-    def getValue(self):
+    def getValue(self,baseDir=None):
         return NotImplemented
 
     @abc.abstractmethod
-    def getGradient(self,mask):
+    def getGradient(self,mask=None,baseDir=None):
         return NotImplemented
 
     def getParameters(self):
@@ -57,6 +75,27 @@ class FunctionBase(abc.ABC):
 
     def getGradientEvalChain(self):
         return []
+
+    def getValueEvalDependencies(self):
+        """List of (evaluation, dependency) pairs, by default each step depends on the previous."""
+        evals = self.getValueEvalChain()
+        return list(zip(evals[1:],evals[0:-1]))
+
+    def getGradientEvalDependencies(self):
+        """Same as getValueEvalDependencies for the gradient evaluation steps."""
+        evals = self.getGradientEvalChain()
+        return list(zip(evals[1:],evals[0:-1]))
+
+    def hasFiniteDifferences(self):
+        return False
+
+    def getFiles(self):
+        """Files read to obtain the value and the gradient (relative to the base directory)."""
+        return []
+
+    def getComponents(self):
+        """Functions whose values are reported (as monitors) when this one is an objective."""
+        return []
 #end
 
 
@@ -94,7 +133,15 @@ class Function(FunctionBase):
         # default value when evaluation fails
         self._defaultValue = None
 
-    def addInputVariable(self,variable,gradFile,gradParser):
+        # finite difference settings and results
+        self._fdStep = None
+        self._fdCentral = False
+        self._fdGroups = None
+        self._fdSubset = None
+        self._fdPerturbations = None
+        self._fdGradient = None
+
+    def addInputVariable(self,variable,gradFile=None,gradParser=None):
         """
         Attach a variable object to the function.
 
@@ -103,6 +150,8 @@ class Function(FunctionBase):
         variable    : The variable object.
         gradFile    : Where to get the gradient of the function w.r.t. the variable.
         gradParser  : The object used to read the gradFile.
+                      File and parser are not needed if the gradient is obtained by
+                      finite differences (see setFiniteDifferences).
         """
         self._variables.append(variable)
         self._gradFiles.append(gradFile)
@@ -116,6 +165,131 @@ class Function(FunctionBase):
             parameters += evl.getParameters()
         return parameters
 
+    def setFiniteDifferences(self,step=1e-6,central=False,groups=None,subset=None):
+        """
+        Obtain the gradient by finite differences instead of reading it from file, e.g. for
+        functions without adjoints. The perturbed designs are generated and evaluated
+        (concurrently) by the driver, see ParallelEvalDriver.setEvaluationMode.
+        Only the value evaluation steps are used.
+
+        Parameters
+        ----------
+        step    : Perturbation size (of the unscaled variables), a scalar, or a dictionary
+                  mapping variables to scalar or array steps.
+        central : True for central differences (twice the cost), False for forward.
+        groups  : Optional dictionary mapping variables to integer arrays (of the same size)
+                  of group numbers. Entries with the same number (across variables) are
+                  perturbed simultaneously, this is only valid if the function depends on
+                  at most one entry of each group.
+        subset  : Optional dictionary mapping variables to the indices that are perturbed,
+                  the derivatives w.r.t. other entries retain their previous values
+                  (initially zero). Variables that are not keys are not perturbed.
+        """
+        self._fdStep = step
+        self._fdCentral = central
+        self._fdGroups = groups
+        self._fdSubset = subset
+        self._fdPerturbations = None
+        self._fdGradient = None
+
+    def hasFiniteDifferences(self):
+        return self._fdStep is not None
+
+    def getFiles(self):
+        return [file for file in [self._outFile]+self._gradFiles if file]
+
+    def getPerturbations(self):
+        """
+        Return the list of perturbations required to compute finite differences, each is a
+        list of (variable, index, delta) tuples. Intended to be used by driver classes.
+        The perturbations depend on the current values of the variables, a step that would
+        leave the bounds is taken in the opposite direction, in central mode both steps
+        are then taken in that direction (one-sided second order differences).
+        """
+        if self._fdPerturbations is None:
+            self._fdPerturbations = self._nominalPerturbations()
+
+        # True if the perturbation keeps the variables within their bounds
+        def feasible(p):
+            for var,i,dx in p:
+                x = var.getCurrent()[i]+dx
+                if x < var.getLowerBound()[i] or x > var.getUpperBound()[i]: return False
+            return True
+        #end
+        flip = lambda p,c: [(var,i,c*dx) for var,i,dx in p]
+
+        if not self._fdCentral:
+            return [p if feasible(p) else flip(p,-1) for p in self._fdPerturbations]
+
+        num = len(self._fdPerturbations)//2
+        plus = []
+        minus = []
+        for p, m in zip(self._fdPerturbations[0:num],self._fdPerturbations[num:]):
+            if not feasible(p): p, m = m, flip(m,2)
+            elif not feasible(m): m = flip(p,2)
+            plus.append(p)
+            minus.append(m)
+        #end
+        return plus+minus
+    #end
+
+    def _nominalPerturbations(self):
+        perturbations = {}
+        for var in self._variables:
+            step = self._fdStep
+            if isinstance(step,dict): step = step.get(var,1e-6)
+            step = np.ones((var.getSize(),))*step
+
+            indices = range(var.getSize())
+            if self._fdSubset is not None: indices = self._fdSubset.get(var,[])
+
+            for i in indices:
+                key = (id(var),i)
+                if self._fdGroups is not None and var in self._fdGroups:
+                    key = self._fdGroups[var][i]
+                perturbations.setdefault(key,[]).append((var,i,step[i]))
+            #end
+        #end
+        perturbations = list(perturbations.values())
+
+        if self._fdCentral:
+            perturbations += [[(var,i,-dx) for var,i,dx in p] for p in perturbations]
+
+        return perturbations
+    #end
+
+    def setFiniteDifferenceValues(self,value,perturbedValues):
+        """
+        Compute the finite difference gradient from the value of the function and the
+        values at the perturbed designs (in the order of getPerturbations).
+        """
+        if self._fdGradient is None:
+            self._fdGradient = dict((var,np.zeros((var.getSize(),))) for var in self._variables)
+
+        perturbations = self.getPerturbations()
+        if self._fdCentral:
+            num = len(perturbations)//2
+            for p, m, fp, fm in zip(perturbations[0:num],perturbations[num:],
+                                    perturbedValues[0:num],perturbedValues[num:]):
+                # steps of h and 2h in the same direction near a bound
+                oneSided = m[0][2] == 2*p[0][2]
+                for var,i,dx in p:
+                    if oneSided: self._fdGradient[var][i] = (4*fp-fm-3*value)/(2*dx)
+                    else: self._fdGradient[var][i] = (fp-fm)/(2*dx)
+                #end
+            #end
+        else:
+            for p, fp in zip(perturbations,perturbedValues):
+                for var,i,dx in p:
+                    self._fdGradient[var][i] = (fp-value)/dx
+            #end
+        #end
+    #end
+
+    def clearFiniteDifferenceValues(self):
+        """Discard the finite difference gradient, e.g. of a copy made for another design."""
+        self._fdGradient = None
+
     def setOutput(self,file,parser):
         self._outFile = file
         self._outParser = parser
@@ -135,30 +309,31 @@ class Function(FunctionBase):
         #end
     #end
 
-    def getValue(self):
+    def getValue(self,baseDir=None):
         """
         Get the function value, i.e. apply the parser to the output file.
         Run the evaluation steps if they have not been executed yet.
-        Note that this method does not have parameters, the current value of the variables
-        is set via the Variable objects.
+        Note that the current value of the variables is set via the Variable objects.
+        The output file and the evaluation steps are relative to "baseDir", by
+        default the current directory.
         """
         # check if we can retrive the value
         self._checkError(self._funEval)
 
         for evl in self._funEval:
             if not evl.isRun():
-                self._sequentialEval(self._funEval)
+                self._sequentialEval(self._funEval,baseDir)
                 break
         #end
-        return self._outParser.read(self._outFile)
+        return self._outParser.read(_resolve(self._outFile,baseDir))
 
-    def getGradient(self,mask=None):
+    def getGradient(self,mask=None,baseDir=None):
         """
         Get the gradient (as a dense vector) of the function, i.e. applies each variable's
         parser. If no mask (dictionary) is provided simple concatenation is performed,
         otherwise each variable's gradient is copied starting at an offset. Note that if a
         mask is provided the size of the resulting vector is the sum of the sizes of the
-        variables used as keys for the dictionary.
+        variables used as keys for the dictionary. Paths are relative to "baseDir".
 
         Example
         -------
@@ -170,7 +345,7 @@ class Function(FunctionBase):
 
         for evl in self._gradEval:
             if not evl.isRun():
-                self._sequentialEval(self._gradEval)
+                self._sequentialEval(self._gradEval,baseDir)
                 break
         #end
 
@@ -181,33 +356,34 @@ class Function(FunctionBase):
         for var in src:
             size += var.getSize()
 
+        if self.hasFiniteDifferences() and self._fdGradient is None:
+            raise RuntimeError("Finite differences were not evaluated.")
+
         # populate gradient vector
-        gradient = np.ndarray((size,))
+        gradient = np.zeros((size,))
         idx = 0
         for var,file,parser in zip(self._variables,self._gradFiles,self._gradParse):
-            grad = parser.read(file)
+            if self.hasFiniteDifferences():
+                grad = self._fdGradient[var]
+            else:
+                grad = parser.read(_resolve(file,baseDir))
             if var.getSize() == 1:
                 # Convert the value to a scalar if it is not yet.
                 try: grad = sum(grad)
                 except: pass
             #end
             if mask is not None: idx = mask[var]
-            try:
-                for val in grad:
-                    gradient[idx] = val
-                    idx += 1
-            except:
-                gradient[idx] = grad
-                idx += 1
-            #end
+            grad = np.ravel(grad)
+            gradient[idx:idx+grad.size] = grad
+            idx += grad.size
         #end
 
         return gradient
     #end
 
-    def _sequentialEval(self,evals):
+    def _sequentialEval(self,evals,baseDir=None):
         for evl in evals:
-            evl.initialize()
+            _initializeStep(evl,baseDir)
             evl.run()
         #end
     #end
@@ -254,7 +430,7 @@ class NonDiscreteness(FunctionBase):
     def addInputVariable(self,variable):
         self._variables.append(variable)
 
-    def getValue(self):
+    def getValue(self,baseDir=None):
         y = 0.0
         N = 0
         for var in self._variables:
@@ -265,7 +441,7 @@ class NonDiscreteness(FunctionBase):
             y += ((ub-x)*(x-lb)/(ub+lb)**2).sum()
         return 4*y/N
 
-    def getGradient(self,mask=None):
+    def getGradient(self,mask=None,baseDir=None):
         # determine size of gradient vector
         N = 0
         for var in self._variables:
@@ -279,7 +455,7 @@ class NonDiscreteness(FunctionBase):
                 size += var.getSize()
 
         # populate gradient vector
-        gradient = np.ndarray((size,))
+        gradient = np.zeros((size,))
         idx = 0
         for var in self._variables:
             x  = var.getCurrent()
@@ -303,3 +479,297 @@ class NonDiscreteness(FunctionBase):
     #end
 #end
 
+
+class AggregateFunction(FunctionBase):
+    """
+    Smooth approximation of the maximum of a set of functions (usually constraints),
+    such that the optimizer sees a single function instead of many.
+    By default the gradient is the weighted sum of the gradients of the functions.
+    Alternatively, the gradient of the aggregate can be computed by a single adjoint
+    (gradient evaluation steps of the aggregate), of the weighted sum of the functions,
+    with the weights written to the configuration via AggregationWeight parameters.
+
+    Parameters
+    ----------
+    name    : String to identify the function.
+    method  : "KS" (Kreisselmeier-Steinhauser) or "pnorm" (for positive functions).
+    rho     : The aggregation factor (the larger the closer to the maximum).
+
+    See also
+    --------
+    AggregationWeight, getWeightParameter.
+    """
+    def __init__(self,name="",method="KS",rho=50.0):
+        FunctionBase.__init__(self,name)
+        if method not in ("KS","pnorm"):
+            raise ValueError("Aggregation method must be \"KS\" or \"pnorm\".")
+        self._method = method
+        self._rho = rho
+        self._functions = []
+
+        # aggregated adjoint, similar to Function
+        self._gradEval = []
+        self._gradFiles = []
+        self._gradParse = []
+
+        # default value when evaluation fails
+        self._defaultValue = None
+
+        # where the values were last obtained, used to compute the weights
+        self._baseDir = None
+
+    def addFunction(self,function):
+        """Add a function to the aggregate."""
+        self._functions.append(function)
+
+    def getFunctions(self):
+        return self._functions
+
+    def addInputVariable(self,variable,gradFile,gradParser):
+        """
+        Attach a variable object to the function, only needed if the gradient is obtained by
+        aggregated adjoint, otherwise the variables are those of the aggregated functions.
+        The gradient file contains the derivatives of the weighted sum of the functions.
+        """
+        self._variables.append(variable)
+        self._gradFiles.append(gradFile)
+        self._gradParse.append(gradParser)
+
+    def addGradientEvalStep(self,evaluation):
+        """Add a required step to compute the aggregated gradient."""
+        self._gradEval.append(evaluation)
+
+    def getWeightParameter(self,index,parser):
+        """Returns a Parameter-like object that writes the weight of the index-th function."""
+        return AggregationWeight(self,index,parser)
+
+    def getVariables(self):
+        if self._gradEval: return self._variables
+        variables = []
+        for fun in self._functions:
+            for var in fun.getVariables():
+                if var not in variables: variables.append(var)
+        return variables
+    #end
+
+    def getFiles(self):
+        files = [file for file in self._gradFiles if file]
+        for fun in self._functions:
+            files += fun.getFiles()
+        return files
+    #end
+
+    def getParameters(self):
+        parameters = []
+        for fun in self._functions:
+            parameters += fun.getParameters()
+        for evl in self._gradEval:
+            parameters += evl.getParameters()
+        return parameters
+    #end
+
+    # scaled values, the largest is 1 for pnorm and 0 for KS
+    def _scaledValues(self,baseDir=None):
+        values = np.array([fun.getValue(baseDir) for fun in self._functions],float)
+        if self._method == "KS":
+            ref = values.max()
+            return (values-ref, ref)
+        ref = max(abs(values).max(),np.finfo(float).tiny)
+        return (values/ref, ref)
+    #end
+
+    def getValue(self,baseDir=None):
+        """Get the aggregated value, running the evaluation steps of the functions if needed."""
+        self._baseDir = baseDir
+        values, ref = self._scaledValues(baseDir)
+        if self._method == "KS":
+            return ref+np.log(np.exp(self._rho*values).sum())/self._rho
+        return ref*(abs(values)**self._rho).sum()**(1.0/self._rho)
+    #end
+
+    def getWeights(self,baseDir=None):
+        """
+        Returns the derivatives of the aggregate w.r.t. each function. By default the values
+        are read from where they were last obtained (see getValue).
+        """
+        if baseDir is None: baseDir = self._baseDir
+        values, ref = self._scaledValues(baseDir)
+        if self._method == "KS":
+            weights = np.exp(self._rho*values)
+            return weights/weights.sum()
+        #end
+        norm = (abs(values)**self._rho).sum()**(1.0/self._rho)
+        return np.sign(values)*(abs(values)/norm)**(self._rho-1.0)
+    #end
+
+    def getGradient(self,mask=None,baseDir=None):
+        """Get the gradient of the aggregate, see Function.getGradient."""
+        self._baseDir = baseDir
+        if not self._gradEval:
+            gradient = None
+            for (fun,w) in zip(self._functions,self.getWeights(baseDir)):
+                grad = fun.getGradient(self._fullMask(mask),baseDir)*w
+                if gradient is None: gradient = grad
+                else: gradient += grad
+            #end
+            return gradient
+        #end
+
+        # the aggregated adjoint
+        for evl in self._gradEval:
+            if evl.isError(): raise RuntimeError("Evaluations failed.")
+        for evl in self._gradEval:
+            if not evl.isRun():
+                for evl in self._gradEval:
+                    _initializeStep(evl,baseDir)
+                    evl.run()
+                #end
+                break
+            #end
+        #end
+
+        size = 0
+        for var in (self._variables if mask is None else mask.keys()):
+            size += var.getSize()
+        gradient = np.zeros((size,))
+        idx = 0
+        for var,file,parser in zip(self._variables,self._gradFiles,self._gradParse):
+            if mask is not None: idx = mask[var]
+            grad = np.array(parser.read(_resolve(file,baseDir)),float).flatten()
+            if var.getSize() == 1: grad = grad.sum()
+            gradient[idx:idx+var.getSize()] = grad
+            idx += var.getSize()
+        #end
+        return gradient
+    #end
+
+    # without a mask the functions need one that includes the variables of all functions
+    def _fullMask(self,mask):
+        if mask is not None: return mask
+        mask = {}
+        idx = 0
+        for var in self.getVariables():
+            mask[var] = idx
+            idx += var.getSize()
+        #end
+        return mask
+    #end
+
+    # unique evaluations of the functions in order
+    @staticmethod
+    def _unique(chains):
+        evals = []
+        for chain in chains:
+            for evl in chain:
+                if evl not in evals: evals.append(evl)
+        return evals
+    #end
+
+    def getValueEvalChain(self):
+        return self._unique(fun.getValueEvalChain() for fun in self._functions)
+
+    def getGradientEvalChain(self):
+        if self._gradEval: return self._gradEval
+        return self._unique(fun.getGradientEvalChain() for fun in self._functions)
+
+    # the chains of the functions are independent, i.e. not consecutive
+    def getValueEvalDependencies(self):
+        return self._unique(fun.getValueEvalDependencies() for fun in self._functions)
+
+    def getGradientEvalDependencies(self):
+        if self._gradEval: return FunctionBase.getGradientEvalDependencies(self)
+        return self._unique(fun.getGradientEvalDependencies() for fun in self._functions)
+
+    def resetValueEvalChain(self):
+        for fun in self._functions:
+            fun.resetValueEvalChain()
+
+    def resetGradientEvalChain(self):
+        for fun in self._functions:
+            fun.resetGradientEvalChain()
+        for evl in self._gradEval:
+            evl.finalize()
+    #end
+
+    def hasDefaultValue(self):
+        return self._defaultValue is not None
+
+    def setDefaultValue(self,value):
+        """Give a default value to the function, to be used in case the evaluation fails."""
+        self._defaultValue = value
+
+    def getDefaultValue(self):
+        return self._defaultValue
+#end
+
+
+class WeightedSum(AggregateFunction):
+    """
+    Weighted sum of functions, e.g. a combined objective whose gradient is computed by a
+    single adjoint (see AggregateFunction). When used as an objective the functions are
+    also added to the driver as monitors to report their individual values.
+
+    Parameters
+    ----------
+    name    : String to identify the function.
+    """
+    def __init__(self,name=""):
+        AggregateFunction.__init__(self,name)
+        self._weights = []
+
+    def addFunction(self,function,weight=1.0):
+        """Add a function to the sum with the given weight."""
+        self._functions.append(function)
+        self._weights.append(weight)
+
+    def getComponents(self):
+        return self._functions
+
+    def getValue(self,baseDir=None):
+        """Get the weighted sum, running the evaluation steps of the functions if needed."""
+        return sum(w*fun.getValue(baseDir) for (fun,w) in zip(self._functions,self._weights))
+
+    def getWeights(self,baseDir=None):
+        """Returns the weights of the functions."""
+        return np.array(self._weights,float)
+#end
+
+
+class AggregationWeight:
+    """
+    Parameter that writes the current weight (derivative of the aggregate w.r.t. one of the
+    functions) of an AggregateFunction (or WeightedSum), to configure the objective of an
+    aggregated adjoint.
+    The weight is computed from the function values when the configuration is written.
+    Updates (increment/decrement) have no effect.
+
+    Parameters
+    ----------
+    aggregate : The AggregateFunction.
+    index     : Index of the function in the aggregate.
+    parser    : How the value is written to file.
+    """
+    def __init__(self,aggregate,index,parser):
+        self._aggregate = aggregate
+        self._index = index
+        self._parser = parser
+
+    def increment(self):
+        return True
+
+    def decrement(self):
+        return True
+
+    def getValue(self):
+        """Returns the current weight."""
+        return self._aggregate.getWeights()[self._index]
+
+    def writeToFile(self,file):
+        self._parser.write(file,self.getValue())
+
+    def isAtTop(self):
+        return True
+
+    def isAtBottom(self):
+        return True
+#end
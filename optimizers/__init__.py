@@ -1,2 +1,3 @@
 from .fletcher_reeves import *
 from .line_searches import *
+from .lbfgs import *
@@ -15,11 +15,11 @@
 #  You should have received a copy of the GNU Lesser General Public License
 #  along with FADO.  If not, see <https://www.gnu.org/licenses/>.
 
-from .line_searches import goldenSection
+from .line_searches import goldenSection, quadraticInterp, strongWolfe, parallelGoldenSection
 import numpy as np
 
 
-def fletcherReeves(fun,x,grad,options,lineSearch=goldenSection):
+def fletcherReeves(fun,x,grad,options,lineSearch=None,funBatch=None):
     """
     Fletcher-Reeves method. The interface and options are similar to SciPy's L-BFGS-B.
 
@@ -35,13 +35,29 @@ def fletcherReeves(fun,x,grad,options,lineSearch=goldenSection):
                   "disp" True to print messages [False];
                   "maxcor" restart period of the method [x.size+1];
                   "maxls" maximum number of line searches per iteration [20];
-                  "tolls" stopping criteria for line searches [1e-3].
-    lineSearch  : The line search method used.
+                  "tolls" stopping criteria for line searches [1e-3];
+                  "cheapgrad" True if gradients are cheap (only for strongWolfe) [False];
+                  "callback" called with x after each iteration, if it returns True the
+                             function changed, it is evaluated again and the method restarts
+                             [by default that of the driver of "fun", if it has one].
+    lineSearch  : The line search method used, by default goldenSection, or parallelGoldenSection
+                  if "funBatch" is provided. With strongWolfe the gradients computed
+                  during the line search are reused for the next search direction.
+    funBatch    : Optional callable that evaluates the function at several points (rows
+                  of a 2D numpy array) and returns an array of values. If provided, the
+                  line search method must be a parallel one (which takes lists of steps).
 
     See also
     --------
-    goldenSection and quadraticInterpolation line search methods.
+    goldenSection and quadraticInterpolation line search methods, and their parallel
+    variants parallelGoldenSection and parallelQuadraticInterp, strongWolfe.
     """
+    if lineSearch is None:
+        lineSearch = (parallelGoldenSection,goldenSection)[funBatch is None]
+    elif funBatch is not None and lineSearch in (goldenSection,quadraticInterp,strongWolfe):
+        raise ValueError("A parallel line search is required to use funBatch.")
+    #end
+
     # unpack options
     ftol = options["ftol"]
     gtol = options["gtol"]
@@ -54,6 +70,27 @@ def fletcherReeves(fun,x,grad,options,lineSearch=goldenSection):
     if "maxls" in options.keys(): maxls = options["maxls"]
     tolls = 0.001
     if "tolls" in options.keys(): tolls = options["tolls"]
+    cheapGrad = False
+    if "cheapgrad" in options.keys(): cheapGrad = options["cheapgrad"]
+    callback = None
+    if "callback" in options.keys(): callback = options["callback"]
+    elif hasattr(getattr(fun,"__self__",None),"getIterationCallback"):
+        # e.g. so that ExteriorPenaltyDriver updates do not happen during line searches
+        callback = fun.__self__.getIterationCallback()
+    wolfe = lineSearch is strongWolfe
+
+    if wolfe:
+        # keeps the last gradient, which is at the accepted step
+        njls = [0]
+        def lsgrad(step):
+            njls[0] += 1
+            lsgrad.G = grad(x+step*S).copy()
+            return lsgrad.G.dot(S)
+        #end
+        # small c2 to ensure the next direction is a descent one
+        lineSearch = lambda lsfun,maxls,f0,lbd,tol: strongWolfe(lsfun,lsgrad,maxls,f0,\
+            G.dot(S),lbd,c2=0.1,cheapGrad=cheapGrad)[0:3]
+    #end
 
     if verbose:
         headerLine = ""
@@ -85,7 +122,11 @@ def fletcherReeves(fun,x,grad,options,lineSearch=goldenSection):
         if verbose and i%10==0 and i>0: print(headerLine)
 
         # line search
-        lsfun = lambda step: fun(x+step*S)
+        if funBatch is None:
+            lsfun = lambda step: fun(x+step*S)
+        else:
+            lsfun = lambda steps: funBatch(np.array([x+step*S for step in steps]))
+        if wolfe and G.dot(S) >= 0.0: S = -G
 
         if lbd<=0: lbd = 1.0
         else: lbd *= max(abs(S))/max(abs(S_old))
@@ -122,8 +163,14 @@ def fletcherReeves(fun,x,grad,options,lineSearch=goldenSection):
         x += lbd*S
         G_old = G
         S_old = S
-        G = grad(x)
-        jeval += 1
+        if wolfe:
+            G = lsgrad.G
+            jeval += njls[0]
+            njls[0] = 0
+        else:
+            G = grad(x)
+            jeval += 1
+        #end
         S = -G+G.dot(G)/G_old.dot(G_old)*S_old
 
         # log
@@ -134,6 +181,16 @@ def fletcherReeves(fun,x,grad,options,lineSearch=goldenSection):
         if f_old-f < ftol or max(abs(G)) < gtol:
             success = True
             break
+        #end
+
+        # e.g. penalty updates, the current point is evaluated again
+        if callback is not None and callback(x):
+            f = fun(x)
+            G = grad(x)
+            feval += 1
+            jeval += 1
+            S = -G
+        #end
     #end
 
     result = {"x" : x, "fun" : f, "jac" : G, "nit" : i+1,
@@ -0,0 +1,231 @@
+#  Copyright 2019-2025, FADO Contributors (cf. AUTHORS.md)
+#
+#  This file is part of FADO.
+#
+#  FADO is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Lesser General Public License as published
+#  by the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  FADO is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public License
+#  along with FADO.  If not, see <https://www.gnu.org/licenses/>.
+from .line_searches import strongWolfe
+import numpy as np
+
+
+def lbfgs(fun,x,grad,options,lb=None,ub=None):
+    """
+    Limited-memory BFGS method with simple bounds (active set) and a line search that
+    satisfies the strong Wolfe conditions (strongWolfe). The interface and options are similar to
+    SciPy's L-BFGS-B, and the same as fletcherReeves.
+
+    Parameters
+    ----------
+    fun         : Callable function, should take a numpy array and return a float.
+    x           : The starting point of the optimization.
+    grad        : Callable gradient method, takes and returns a numpy array.
+    options     : Dictionary of options:
+                  "ftol" function-based tolerance [no default];
+                  "gtol" norm of projected gradient-based tolerance [no default];
+                  "maxiter" maximum number of iterations [no default];
+                  "disp" True to print messages [False];
+                  "maxcor" number of correction pairs kept [10];
+                  "maxls" maximum number of line searches per iteration [20];
+                  "cheapgrad" True if gradients are cheap (see strongWolfe) [False];
+                  "memory" LBFGSMemory object used to keep the correction pairs between
+                           calls, it overrides "maxcor" [None];
+                  "callback" called with x after each iteration, if it returns True the
+                             function changed and it is evaluated again
+                             [by default that of the driver of "fun", if it has one].
+    lb          : Lower bounds of the variables (e.g. driver.getLowerBound()).
+    ub          : Upper bounds of the variables.
+    """
+    # unpack options
+    ftol = options["ftol"]
+    gtol = options["gtol"]
+    maxiter = options["maxiter"]
+    verbose = False
+    if "disp" in options.keys(): verbose = options["disp"]
+    maxcor = 10
+    if "maxcor" in options.keys(): maxcor = options["maxcor"]
+    maxls = 20
+    if "maxls" in options.keys(): maxls = options["maxls"]
+    cheapGrad = False
+    if "cheapgrad" in options.keys(): cheapGrad = options["cheapgrad"]
+    memory = None
+    if "memory" in options.keys(): memory = options["memory"]
+    if memory is None: memory = LBFGSMemory(maxcor)
+    callback = None
+    if "callback" in options.keys(): callback = options["callback"]
+    elif hasattr(getattr(fun,"__self__",None),"getIterationCallback"):
+        # e.g. so that ExteriorPenaltyDriver updates do not happen during line searches
+        callback = fun.__self__.getIterationCallback()
+
+    if lb is None: lb = np.full(x.shape,-np.inf)
+    if ub is None: ub = np.full(x.shape,np.inf)
+    x[()] = np.clip(x,lb,ub)
+
+    if verbose:
+        headerLine = ""
+        for data in ["ITER","FUN EVAL","GRAD EVAL","STEP","FUN EPS","GRAD EPS","FUN VAL"]:
+            headerLine += data.rjust(13)
+        logFormat = "{:>13}"*3+"{:>13.6g}"*4
+        print("\n"+"*"*40+" L-BFGS Method "+"*"*40+"\n")
+        print("Number of variables: "+str(x.size)+"    Correction pairs: "+str(len(memory))+"\n")
+        print(headerLine)
+    #end
+
+    # initialize
+    feval = 1
+    jeval = 1
+    f = fun(x)
+    G = grad(x).copy()
+    success = False
+
+    # log
+    projGrad = lambda x,G: max(abs(np.clip(x-G,lb,ub)-x))
+    logData = [0, 1, 1, 0.0, 0.0, projGrad(x,G), f]
+    if verbose: print(logFormat.format(*logData))
+
+    # start
+    for i in range(maxiter):
+        if verbose and i%10==0 and i>0: print(headerLine)
+
+        # variables at the bounds that the gradient pushes outwards are fixed
+        free = ~(((x <= lb) & (G > 0.0)) | ((x >= ub) & (G < 0.0)))
+
+        S = _twoLoop(G*free,memory.getPairs())*free
+        if S.dot(G) >= 0.0:
+            if verbose: print("Bad search direction, taking steepest descent.")
+            memory.clear()
+            S = -G*free
+        #end
+        if not S.any():
+            success = True
+            break
+        #end
+
+        # the first step is scaled, then the unit step is tried first
+        lbd = 1.0
+        if len(memory) == 0: lbd = min(1.0,1.0/max(abs(S)))
+
+        # the step is limited by the first bound that is reached
+        with np.errstate(divide="ignore",invalid="ignore"):
+            lbdMax = np.where(S > 0.0,(ub-x)/S,np.where(S < 0.0,(lb-x)/S,np.inf)).min()
+        lbd = min(lbd,lbdMax)
+
+        # line search, the gradient at the accepted step is kept
+        lsfun = lambda step: fun(x+step*S)
+        def lsgrad(step):
+            lsgrad.G = grad(x+step*S).copy()
+            return lsgrad.G.dot(S)
+        #end
+        f_old = f
+        (lbd,f,nls,njs) = strongWolfe(lsfun,lsgrad,maxls,f,G.dot(S),lbd,lbdMax,cheapGrad=cheapGrad)
+        feval += nls
+        jeval += njs
+
+        if lbd == 0.0:
+            if len(memory) > 0:
+                if verbose: print("Line search failed, resetting the correction pairs.")
+                memory.clear()
+                continue
+            #end
+            if verbose: print("Could not improve along steepest descent direction.")
+            break
+        #end
+
+        # update the design and the correction pairs
+        x_old = x.copy()
+        x += lbd*S
+        x[()] = np.clip(x,lb,ub)
+        s = x-x_old
+        y = lsgrad.G-G
+        G = lsgrad.G
+        memory.add(s,y)
+
+        # log
+        logData = [i+1, feval, jeval, lbd, f_old-f, projGrad(x,G), f]
+        if verbose: print(logFormat.format(*logData))
+
+        # convergence criteria
+        if f_old-f < ftol or projGrad(x,G) < gtol:
+            success = True
+            break
+        #end
+
+        # e.g. penalty updates, the current point is evaluated again
+        if callback is not None and callback(x):
+            f = fun(x)
+            G = grad(x).copy()
+            feval += 1
+            jeval += 1
+        #end
+    #end
+
+    result = {"x" : x, "fun" : f, "jac" : G, "nit" : i+1,
+              "nfev" : feval, "njev" : jeval, "success" : success}
+    return result
+#end
+
+
+class LBFGSMemory:
+    """
+    Correction pairs (s,y) of the L-BFGS method. Passing the same object to successive
+    calls of lbfgs (via options["memory"]) warm-starts the Hessian approximation, e.g.
+    between the penalty updates of ExteriorPenaltyDriver (see setQuasiNewtonMemory).
+
+    Parameters
+    ----------
+    maxcor : Maximum number of pairs kept, the oldest are discarded first.
+    """
+    def __init__(self,maxcor=10):
+        self._maxcor = maxcor
+        self._pairs = []
+
+    def add(self,s,y):
+        """Add a pair, it is ignored if it does not meet the curvature condition."""
+        if s.dot(y) <= np.finfo(float).eps*y.dot(y): return False
+        self._pairs.append((s.copy(),y.copy()))
+        if len(self._pairs) > self._maxcor: self._pairs.pop(0)
+        return True
+    #end
+
+    def clear(self):
+        """Discard all pairs."""
+        self._pairs = []
+
+    def getPairs(self):
+        """Returns the list of pairs, oldest first."""
+        return self._pairs
+
+    def __len__(self):
+        return len(self._pairs)
+#end
+
+
+# Two-loop recursion, returns -H*G where H is the inverse Hessian approximation
+# defined by the correction pairs.
+def _twoLoop(G,pairs):
+    q = G.copy()
+    alpha = []
+    for (s,y) in reversed(pairs):
+        a = s.dot(q)/s.dot(y)
+        q -= a*y
+        alpha.append(a)
+    #end
+    if pairs:
+        (s,y) = pairs[-1]
+        q *= s.dot(y)/y.dot(y)
+    #end
+    for ((s,y),a) in zip(pairs,reversed(alpha)):
+        b = y.dot(q)/s.dot(y)
+        q += (a-b)*s
+    #end
+    return -q
+#end
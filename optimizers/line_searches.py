@@ -15,6 +15,8 @@
 #  You should have received a copy of the GNU Lesser General Public License
 #  along with FADO.  If not, see <https://www.gnu.org/licenses/>.
 
+import numpy as np
+
 
 def goldenSection(fun,maxiter,f0=None,lbd0=1,tol=1e-3):
     """1D minimization using the Golden Section method."""
@@ -82,6 +84,109 @@ def goldenSection(fun,maxiter,f0=None,lbd0=1,tol=1e-3):
 #end
 
 
+def strongWolfe(fun,grad,maxiter,f0,df0,lbd0=1,lbdMax=np.inf,c1=1e-4,c2=0.9,cheapGrad=False):
+    """
+    1D minimization to find a step that satisfies the strong Wolfe conditions.
+    Unlike the other line searches this one uses the derivative along the search
+    direction, "grad" takes a step and returns that derivative, and "df0" is its value
+    at the start. By default the derivative is only requested at steps with sufficient
+    decrease, with cheapGrad=True it is requested at all steps (which improves the
+    interpolation). Reaching lbdMax with sufficient decrease is also accepted.
+    Returns the step, the function value, and the number of function and derivative
+    evaluations. The last derivative evaluation is always at the step returned,
+    unless the step is 0 (failure to find sufficient decrease).
+    """
+    feval = 0
+    jeval = 0
+    lastGrad = [None]
+
+    def dfun(lbd):
+        lastGrad[0] = lbd
+        return grad(lbd)
+    #end
+
+    # best point with sufficient decrease so far (used as fallback)
+    best = (0.0, f0)
+    armijo = lambda lbd,f: f <= f0+c1*lbd*df0
+
+    # bracketing phase
+    lbd_lo, f_lo, df_lo = 0.0, f0, df0
+    lbd = min(lbd0,lbdMax)
+    zoom = False
+    while feval < maxiter:
+        f = fun(lbd)
+        feval += 1
+        df = None
+        if cheapGrad or armijo(lbd,f):
+            df = dfun(lbd)
+            jeval += 1
+        #end
+        if not armijo(lbd,f) or (feval > 1 and f >= f_lo):
+            lbd_hi, f_hi, df_hi = lbd, f, df
+            zoom = True
+            break
+        #end
+        best = (lbd, f)
+        if abs(df) <= -c2*df0 or lbd >= lbdMax: return (lbd,f,feval,jeval)
+        if df >= 0.0:
+            lbd_hi, f_hi, df_hi = lbd_lo, f_lo, df_lo
+            lbd_lo, f_lo, df_lo = lbd, f, df
+            zoom = True
+            break
+        #end
+        lbd_lo, f_lo, df_lo = lbd, f, df
+        lbd = min(2.0*lbd,lbdMax)
+    #end
+
+    # zoom phase
+    while zoom and feval < maxiter:
+        delta = lbd_hi-lbd_lo
+        lbd = lbd_lo+0.5*delta
+        d1 = 0.0
+        if df_hi is not None:
+            # cubic interpolation
+            d1 = df_lo+df_hi-3.0*(f_lo-f_hi)/(lbd_lo-lbd_hi)
+            d1 = d1**2-df_lo*df_hi
+        #end
+        if d1 > 0.0:
+            d2 = np.sign(delta)*np.sqrt(d1)
+            d1 = df_lo+df_hi-3.0*(f_lo-f_hi)/(lbd_lo-lbd_hi)
+            lbd = lbd_hi-delta*(df_hi+d2-d1)/(df_hi-df_lo+2.0*d2)
+        else:
+            # quadratic interpolation using the derivative at the low end
+            den = 2.0*(f_hi-f_lo-df_lo*delta)
+            if den > 0.0: lbd = lbd_lo-df_lo*delta**2/den
+        #end
+        # safeguard
+        if not abs(lbd-lbd_lo) > 0.1*abs(delta) or not abs(lbd_hi-lbd) > 0.1*abs(delta):
+            lbd = lbd_lo+0.5*delta
+
+        f = fun(lbd)
+        feval += 1
+        df = None
+        if cheapGrad or (armijo(lbd,f) and f < f_lo):
+            df = dfun(lbd)
+            jeval += 1
+        #end
+        if not armijo(lbd,f) or f >= f_lo:
+            lbd_hi, f_hi, df_hi = lbd, f, df
+        else:
+            best = (lbd, f)
+            if abs(df) <= -c2*df0: break
+            if df*delta >= 0.0: lbd_hi, f_hi, df_hi = lbd_lo, f_lo, df_lo
+            lbd_lo, f_lo, df_lo = lbd, f, df
+        #end
+    #end
+
+    # make sure the last derivative evaluation is at the step returned
+    if best[0] > 0.0 and lastGrad[0] != best[0]:
+        grad(best[0])
+        jeval += 1
+    #end
+    return best+(feval,jeval)
+#end
+
+
 def quadraticInterp(fun,maxiter,f0=None,lbd0=1,tol=1e-3):
     """1D minimization using the Quadratic Interpolation method."""
     # initialize
@@ -156,3 +261,126 @@ def quadraticInterp(fun,maxiter,f0=None,lbd0=1,tol=1e-3):
 
     return (x_opt,y_min,feval)
 #end
+
+
+# Bracket the minimum along a descent direction with a geometric ladder of k steps
+# per round, "fun" takes a list of steps. Returns the evaluated points, sorted by
+# step, the index of the lowest value, and the number of evaluations.
+def _parallelBracket(fun,maxiter,f0,lbd0,k):
+    feval = 0
+    if f0 is None:
+        f0 = fun([0.0])[0]
+        feval += 1
+    x = [0.0]
+    y = [f0]
+
+    # the minimum is bracketed once the last point is not the lowest
+    while True:
+        steps = [lbd0*2.0**i for i in range(k)]
+        x += steps
+        y += list(fun(steps))
+        feval += k
+        imin = min(range(len(y)),key=lambda i: y[i])
+        if imin < len(y)-1 or feval >= maxiter: break
+        lbd0 = 2.0*steps[-1]
+    #end
+    return (x,y,imin,feval)
+#end
+
+
+def parallelGoldenSection(fun,maxiter,f0=None,lbd0=1,tol=1e-3,k=4):
+    """
+    1D minimization using k-section, a parallel variant of the Golden Section method.
+    "fun" takes a list of k step lengths and returns a list of values, i.e. it evaluates
+    k points per round. The minimum is bracketed by a geometric ladder of steps
+    (lbd0*2^i) and the bracket is refined by evaluating k equally spaced interior points,
+    which shrinks it by a factor of (k+1)/2 per round.
+    """
+    x, y, imin, feval = _parallelBracket(fun,maxiter,f0,lbd0,k)
+    if imin == len(y)-1: return (x[imin],y[imin],feval)
+
+    # bracket around the lowest point
+    a = max(imin-1,0)
+    x = x[a:imin+2]
+    y = y[a:imin+2]
+    width = x[-1]-x[0]
+
+    while feval < maxiter and (x[-1]-x[0])/width >= tol:
+        steps = [x[0]+(x[-1]-x[0])*(j+1)/(k+1) for j in range(k)]
+        vals = list(fun(steps))
+        feval += k
+
+        xy = sorted(zip(x+steps,y+vals))
+        x = [p[0] for p in xy]
+        y = [p[1] for p in xy]
+        imin = min(range(len(y)),key=lambda i: y[i])
+        a = max(imin-1,0)
+        x = x[a:imin+2]
+        y = y[a:imin+2]
+    #end
+
+    imin = min(range(len(y)),key=lambda i: y[i])
+    return (x[imin],y[imin],feval)
+#end
+
+
+def parallelQuadraticInterp(fun,maxiter,f0=None,lbd0=1,tol=1e-3,k=4):
+    """
+    1D minimization using Quadratic Interpolation, parallel variant that evaluates
+    k points per round (see parallelGoldenSection). After bracketing, each round
+    evaluates the minimum of the quadratic through the lowest point and its neighbors,
+    and k-1 points spread symmetrically around it within the bracket. While the lowest
+    point is the start of the bracket, its interior is k-sectioned instead.
+    """
+    x, y, imin, feval = _parallelBracket(fun,maxiter,f0,lbd0,k)
+    if imin == len(y)-1: return (x[imin],y[imin],feval)
+
+    # bracket around the lowest point
+    a = max(imin-1,0)
+    x = x[a:imin+2]
+    y = y[a:imin+2]
+    y_ref = max(max(y),-min(y),tol)
+
+    while feval < maxiter:
+        imin = min(range(len(y)),key=lambda i: y[i])
+        y_star = None
+
+        if imin == 0:
+            steps = [x[0]+(x[1]-x[0])*(j+1)/(k+1) for j in range(k)]
+        else:
+            # quadratic through the lowest point and its neighbors
+            (x0,x1,x2) = x[0:3]
+            (y0,y1,y2) = y[0:3]
+            det = (x0-x1)*(x1-x2)*(x2-x0)
+            b = (y0*(x1**2-x2**2) + y1*(x2**2-x0**2) + y2*(x0**2-x1**2))/det
+            c = -(y0*(x1-x2) + y1*(x2-x0) + y2*(x0-x1))/det
+            a = y0-b*x0-c*x0**2
+            x_opt = min(max(-0.5*b/c,x0),x2)
+            y_star = a+b*x_opt+c*x_opt**2
+
+            # the remaining points are spread around x_opt within the bracket
+            steps = [x_opt]
+            delta = (x2-x0)/(2*k)
+            for j in range(1,k):
+                offset = ((j+1)//2)*delta*(1-2*(j%2==0))
+                steps.append(min(max(x_opt+offset,x0+0.5*delta),x2-0.5*delta))
+            #end
+        #end
+        vals = list(fun(steps))
+        feval += k
+
+        xy = sorted(set(zip(x+steps,y+vals)))
+        x = [p[0] for p in xy]
+        y = [p[1] for p in xy]
+        imin = min(range(len(y)),key=lambda i: y[i])
+        a = max(imin-1,0)
+        x = x[a:imin+2]
+        y = y[a:imin+2]
+
+        # check convergence
+        if y_star is not None and abs(vals[0]-y_star)/y_ref < tol: break
+    #end
+
+    imin = min(range(len(y)),key=lambda i: y[i])
+    return (x[imin],y[imin],feval)
+#end
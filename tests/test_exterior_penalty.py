@@ -0,0 +1,67 @@
+#  Copyright 2019-2025, FADO Contributors (cf. AUTHORS.md)
+#
+#  This file is part of FADO.
+#
+#  FADO is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Lesser General Public License as published
+#  by the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  FADO is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public License
+#  along with FADO.  If not, see <https://www.gnu.org/licenses/>.
+
+import sys
+import numpy as np
+from FADO import *
+
+
+# f = (x-2)^2 and g = x, written with their derivatives
+SCRIPT = "x=float(open('config.txt').read());"+\
+         "open('out.txt','w').write('%r\\n%r\\n%r\\n%r' % ((x-2)**2,x,2*(x-2),1.0))"
+
+
+def test_no_penalty_updates_during_line_searches(tmp_path,monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with open("config.txt","w") as f: f.write("__X__")
+
+    var = InputVariable(0.0,LabelReplacer("__X__"))
+    run = ExternalRun("RUN",'"'+sys.executable+'" -c "'+SCRIPT+'"')
+    run.addConfig("config.txt")
+    fun = Function("f","RUN/out.txt",TableReader(0,0))
+    fun.addInputVariable(var,"RUN/out.txt",TableReader(2,0))
+    fun.addValueEvalStep(run)
+    con = Function("g","RUN/out.txt",TableReader(1,0))
+    con.addInputVariable(var,"RUN/out.txt",TableReader(3,0))
+    con.addValueEvalStep(run)
+
+    # updates would be due at every gradient evaluation, including those of line searches
+    driver = ExteriorPenaltyDriver(1e-3,freq=1)
+    driver.addObjective("min",fun)
+    driver.addUpperBound(con,1.0)
+    driver.preprocess()
+
+    inLineSearch = [False]
+    updates = []
+    module = sys.modules["FADO.optimizers.lbfgs"]
+    strongWolfe = module.strongWolfe
+    def lineSearch(*args,**kwargs):
+        inLineSearch[0] = True
+        try: return strongWolfe(*args,**kwargs)
+        finally: inLineSearch[0] = False
+    #end
+    monkeypatch.setattr(module,"strongWolfe",lineSearch)
+    update = driver.update
+    def recordUpdate(*args,**kwargs):
+        updates.append(inLineSearch[0])
+        update(*args,**kwargs)
+    #end
+    monkeypatch.setattr(driver,"update",recordUpdate)
+
+    options = {"ftol" : 1e-12, "gtol" : 1e-12, "maxiter" : 4}
+    lbfgs(driver.fun,driver.getInitial(),driver.grad,options)
+    assert updates and not any(updates)
@@ -0,0 +1,53 @@
+#  Copyright 2019-2025, FADO Contributors (cf. AUTHORS.md)
+#
+#  This file is part of FADO.
+#
+#  FADO is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Lesser General Public License as published
+#  by the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  FADO is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public License
+#  along with FADO.  If not, see <https://www.gnu.org/licenses/>.
+
+import sys
+import numpy as np
+from FADO import *
+
+
+SCRIPT = "x=[float(t) for t in open('config.txt').read().split(',')];"+\
+         "open('out.txt','w').write(str(x[0]**3+x[1]**2))"
+
+
+def test_batch_finite_differences(tmp_path,monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with open("config.txt","w") as f: f.write("__X__")
+
+    var = InputVariable(np.array([0.5,0.5]),ArrayLabelReplacer("__X__"),
+                        lb=np.zeros((2,)),ub=np.ones((2,)))
+    run = ExternalRun("RUN",'"'+sys.executable+'" -c "'+SCRIPT+'"')
+    run.addConfig("config.txt")
+    fun = Function("f","RUN/out.txt",TableReader(0,0))
+    fun.addInputVariable(var)
+    fun.addValueEvalStep(run)
+    fun.setFiniteDifferences(1e-5)
+
+    driver = ExteriorPenaltyDriver(0.01,0)
+    driver.addObjective("min",fun)
+    driver.setEvaluationMode(True,0.01)
+    driver.preprocess()
+
+    # the gradient of the current design must not be reused for the batch designs
+    assert np.allclose(driver.grad(driver.getInitial()),[0.75,1.0],atol=1e-3)
+
+    # the second design is on the upper bound of x[0]
+    X = np.array([[0.2,0.3],[1.0,0.1]])
+    result = driver.evaluateBatch(X,gradients=True)
+    analytic = np.array([[3*x[0]**2,2*x[1]] for x in X])
+    assert np.allclose(result["fun"][:,0],X[:,0]**3+X[:,1]**2)
+    assert np.allclose(result["grad"][:,0,:],analytic,atol=1e-3)
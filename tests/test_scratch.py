@@ -0,0 +1,57 @@
+#  Copyright 2019-2025, FADO Contributors (cf. AUTHORS.md)
+#
+#  This file is part of FADO.
+#
+#  FADO is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Lesser General Public License as published
+#  by the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  FADO is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public License
+#  along with FADO.  If not, see <https://www.gnu.org/licenses/>.
+
+import os
+import shutil
+import numpy as np
+from conftest import ROOT
+
+
+# runs the problem definition of the rosenbrock example as is, returns the driver
+def _rosenbrockDriver():
+    with open("example.py") as f:
+        source = f.read().split("# Optimization")[0]
+    namespace = {}
+    exec(source,namespace)
+    return namespace["driver"]
+#end
+
+
+def test_rosenbrock_in_scratch_mode(tmp_path,monkeypatch):
+    example = os.path.join(ROOT,"examples","rosenbrock")
+    for name in os.listdir(example):
+        if os.path.isfile(os.path.join(example,name)): shutil.copy(os.path.join(example,name),tmp_path)
+    monkeypatch.chdir(tmp_path)
+
+    driver = _rosenbrockDriver()
+    x = driver.getInitial()
+    reference = (driver.fun(x), driver.grad(x).copy())
+
+    # the example runs "../../direct.py", i.e. the scratch directory must be two levels down
+    os.mkdir("scratch")
+    driver = _rosenbrockDriver()
+    driver.setWorkingDirectory("__SCRATCH__")
+    driver.setScratchDirectory("scratch")
+    assert np.isclose(driver.fun(x),reference[0])
+    assert np.allclose(driver.grad(x),reference[1])
+
+    # only the files read by functions and other runs are copied back
+    assert os.path.isfile(os.path.join("__SCRATCH__","RUN1","results.txt"))
+    assert os.path.isfile(os.path.join("__SCRATCH__","JAC1","gradient.txt"))
+    assert not os.path.exists(os.path.join("__SCRATCH__","RUN1","config_tmpl.txt"))
+    assert os.listdir("scratch") == []
+#end
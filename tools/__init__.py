@@ -1,2 +1,3 @@
 from .file_parser import *
 from .variable_transformation import *
+from .shared_array import *
@@ -15,6 +15,7 @@
 #  You should have received a copy of the GNU Lesser General Public License
 #  along with FADO.  If not, see <https://www.gnu.org/licenses/>.
 
+import os
 import numpy as np
 
 
@@ -329,3 +330,104 @@ class TableWriter:
     #end
 #end
 
+
+class NpyReader:
+    """
+    Reads data from a NumPy (.npy) file, which is memory-mapped so that only the
+    selected entries are read. Returns a copy, a float if only one entry is selected.
+
+    Parameters
+    ----------
+    index : Entries to select (any NumPy index, e.g. 3, slice(0,10), (1,None)),
+            None for the entire array.
+    """
+    def __init__(self,index=None):
+        self._index = index
+
+    def read(self,file):
+        data = np.load(file,mmap_mode="r")
+        if self._index is not None: data = data[self._index]
+        data = np.array(data,dtype=float)
+        if data.size == 1: return float(data.reshape(-1)[0])
+        return data
+    #end
+#end
+
+
+class NpyWriter:
+    """
+    Writes data to a NumPy (.npy) file. By default the file is replaced by an array with
+    the values, otherwise the "index" entries of the existing array are updated in place
+    (memory-mapped), e.g. to write a variable into a larger template array.
+
+    Parameters
+    ----------
+    index : Entries of the existing array to update (same as NpyReader), None to replace it.
+    dtype : Type of the array when it is replaced.
+    """
+    def __init__(self,index=None,dtype=np.float64):
+        self._index = index
+        self._dtype = dtype
+
+    def write(self,file,value):
+        if self._index is None:
+            with open(file,"wb") as f:
+                np.save(f,np.asarray(value,dtype=self._dtype))
+        else:
+            data = np.load(file,mmap_mode="r+")
+            data[self._index] = value
+            data.flush()
+            del data
+        #end
+    #end
+#end
+
+
+class RawReader:
+    """
+    Reads "count" values of type "dtype" from a raw binary file, starting "offset" bytes
+    from the beginning. Returns an array, or a float if count is 1.
+
+    Parameters
+    ----------
+    dtype  : Type of the values, e.g. "float64", "<f4" (little-endian single precision).
+    offset : Position of the first value in bytes.
+    count  : Number of values, -1 to read until the end of the file.
+    """
+    def __init__(self,dtype=np.float64,offset=0,count=-1):
+        self._dtype = np.dtype(dtype)
+        self._offset = offset
+        self._count = count
+
+    def read(self,file):
+        data = np.fromfile(file,self._dtype,self._count,offset=self._offset)
+        if self._count > 0 and data.size < self._count:
+            raise RuntimeError("File '"+file+"' is too short.")
+        if self._count == 1: return float(data[0])
+        return data.astype(float,copy=False)
+    #end
+#end
+
+
+class RawWriter:
+    """
+    Writes values as raw binary data of type "dtype" into a file, starting "offset" bytes
+    from the beginning, the rest of the file is kept (it is extended if needed).
+
+    Parameters
+    ----------
+    dtype  : Type of the values in the file (see RawReader).
+    offset : Position of the first value in bytes.
+    """
+    def __init__(self,dtype=np.float64,offset=0):
+        self._dtype = np.dtype(dtype)
+        self._offset = offset
+
+    def write(self,file,value):
+        mode = ("wb","r+b")[os.path.isfile(file)]
+        with open(file,mode) as f:
+            f.seek(self._offset)
+            np.asarray(value,dtype=self._dtype).tofile(f)
+        #end
+    #end
+#end
@@ -0,0 +1,116 @@
+#  Copyright 2019-2025, FADO Contributors (cf. AUTHORS.md)
+#
+#  This file is part of FADO.
+#
+#  FADO is free software: you can redistribute it and/or modify
+#  it under the terms of the GNU Lesser General Public License as published
+#  by the Free Software Foundation, either version 3 of the License, or
+#  (at your option) any later version.
+#
+#  FADO is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU Lesser General Public License for more details.
+#
+#  You should have received a copy of the GNU Lesser General Public License
+#  along with FADO.  If not, see <https://www.gnu.org/licenses/>.
+
+import os
+import tempfile
+import numpy as np
+
+
+class SharedArray:
+    """
+    A numpy array in a memory-mapped file (np.memmap) that other processes can attach to,
+    by default in /dev/shm (i.e. in memory) when it exists. Pickled copies (e.g. arguments
+    of a PythonRun) attach to the same buffer, codes in other languages can map the file
+    (raw data, C order). The object that creates the array owns the file and deletes it
+    when closed. Copies of the functions for other designs (see evaluateBatch) share the
+    buffer, so batches of designs can only be evaluated with maxParallel=1.
+
+    Parameters
+    ----------
+    shape : Shape of the array.
+    dtype : Type of the entries.
+    file  : Path of the file, by default a new temporary one.
+    """
+    def __init__(self,shape,dtype=np.float64,file=None):
+        if file is None:
+            dir = None
+            if os.path.isdir("/dev/shm"): dir = "/dev/shm"
+            fd, file = tempfile.mkstemp(prefix="fado_",suffix=".bin",dir=dir)
+            os.close(fd)
+        #end
+        self._file = os.path.abspath(file)
+        self._dtype = np.dtype(dtype)
+        self._shape = tuple(int(n) for n in np.atleast_1d(shape))
+        self._owner = True
+        self.array = np.memmap(self._file,self._dtype,"w+",shape=self._shape)
+    #end
+
+    def getFile(self):
+        return self._file
+
+    # copies attach to the same file, only the original owns it
+    def __getstate__(self):
+        return {"_file" : self._file, "_dtype" : self._dtype, "_shape" : self._shape}
+
+    def __setstate__(self,state):
+        self.__dict__.update(state)
+        self._owner = False
+        self.array = np.memmap(self._file,self._dtype,"r+",shape=self._shape)
+    #end
+
+    def close(self):
+        """Release the buffer, and delete the file if this object created it."""
+        self.array = None
+        if self._owner:
+            self._owner = False
+            try: os.remove(self._file)
+            except OSError: pass
+        #end
+    #end
+
+    def __del__(self):
+        self.close()
+#end
+
+
+class SharedArrayReader:
+    """
+    Reads values or gradients from a SharedArray, without parsing, the file name given
+    to read is ignored. Returns a view of the flat array (from "start" to "end"),
+    a float if it has one element.
+    """
+    def __init__(self,shared,start=0,end=None):
+        self._shared = shared
+        self._start = start
+        self._end = end
+
+    def read(self,file):
+        data = self._shared.array.reshape(-1)[self._start:self._end]
+        if data.size == 1: return float(data[0])
+        return data
+    #end
+#end
+
+
+class SharedArrayWriter:
+    """
+    Writes the values of variables to a SharedArray (flat, from "start"), without
+    formatting, the file name given to write is ignored. The variables of a run are
+    written once when it is initialized, even if it has no configuration files.
+    """
+    # see ExternalRun.initialize
+    usesFiles = False
+
+    def __init__(self,shared,start=0):
+        self._shared = shared
+        self._start = start
+
+    def write(self,file,value):
+        value = np.ravel(value)
+        self._shared.array.reshape(-1)[self._start:self._start+value.size] = value
+    #end
+#end
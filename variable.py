@@ -124,6 +124,10 @@ class InputVariable:
 
     def writeToFile(self,file):
         self._parser.write(file,self._x)
+
+    def usesFiles(self):
+        """False if the parser does not write to files (e.g. SharedArrayWriter)."""
+        return getattr(self._parser,"usesFiles",True)
 #end
 
 
@@ -157,11 +161,15 @@ class Parameter:
         self._index = max(0,min(self._upper,self._index-1))
         return self.isAtBottom()
 
-    def writeToFile(self,file):
+    def getValue(self):
+        """Returns the current value (converted by function if one was given)."""
         value = self._values[self._index]
         if self._function != None:
             value = self._function(value)
-        self._parser.write(file,value)
+        return value
+
+    def writeToFile(self,file):
+        self._parser.write(file,self.getValue())
 
     def isAtTop(self):
         """Return True if the current value is the last."""